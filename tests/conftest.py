@@ -64,8 +64,16 @@ def settings_cleanup() -> Iterator[None]:
     settings.MAX_USERS = original_max_users
 
 
+@pytest.fixture(scope="session")
+def client(app: FastAPI) -> Iterator[TestClient]:
+    """Shared client for read-only requests that don't touch cookies or state."""
+    with TestClient(app) as client:
+        yield client
+
+
 @pytest.fixture()
-def client(app: FastAPI) -> TestClient:
+def isolated_client(app: FastAPI) -> TestClient:
+    """Fresh client for tests that mutate server state or session cookies."""
     return TestClient(app)
 
 
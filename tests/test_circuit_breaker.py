@@ -0,0 +1,92 @@
+"""Tests for the httpx circuit breaker transport."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from tronbyt_server.circuit_breaker import CircuitBreakerTransport, CircuitOpenError
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr("time.monotonic", clock)
+    return clock
+
+
+class _Upstream:
+    """Mock transport handler answering with a settable status code."""
+
+    def __init__(self) -> None:
+        self.status_code = 200
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        return httpx.Response(self.status_code)
+
+
+def _get(transport: CircuitBreakerTransport) -> int:
+    async def send() -> int:
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.get("https://example.supabase.co/rest/v1/")
+            return response.status_code
+
+    return asyncio.run(send())
+
+
+def _breaker(upstream: _Upstream) -> CircuitBreakerTransport:
+    return CircuitBreakerTransport(
+        httpx.MockTransport(upstream), failure_threshold=2, reset_timeout=30
+    )
+
+
+def test_circuit_opens_after_consecutive_outages(clock: _Clock) -> None:
+    upstream = _Upstream()
+    upstream.status_code = 503
+    transport = _breaker(upstream)
+
+    assert _get(transport) == 503
+    assert _get(transport) == 503
+    with pytest.raises(CircuitOpenError):
+        _get(transport)
+    assert upstream.calls == 2
+
+
+def test_success_resets_failure_count(clock: _Clock) -> None:
+    upstream = _Upstream()
+    transport = _breaker(upstream)
+
+    for status_code in (503, 200, 503, 500, 404):
+        upstream.status_code = status_code
+        _get(transport)
+
+    assert not transport.is_open
+
+
+def test_probe_after_timeout_closes_or_reopens(clock: _Clock) -> None:
+    upstream = _Upstream()
+    upstream.status_code = 502
+    transport = _breaker(upstream)
+    _get(transport)
+    _get(transport)
+
+    clock.now += 30
+    assert _get(transport) == 502
+    with pytest.raises(CircuitOpenError):
+        _get(transport)
+
+    clock.now += 30
+    upstream.status_code = 200
+    assert _get(transport) == 200
+    assert _get(transport) == 200
+    assert not transport.is_open
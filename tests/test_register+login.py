@@ -29,16 +29,16 @@ def test_register_login_logout(auth_client: TestClient) -> None:
     assert response.headers["location"] == "http://testserver/auth/login"
 
 
-def test_login_with_wrong_password(client: TestClient) -> None:
+def test_login_with_wrong_password(isolated_client: TestClient) -> None:
     # Create owner
-    response = client.post(
+    response = isolated_client.post(
         "/auth/register_owner",
         data={"password": "password"},
         follow_redirects=False,
     )
     assert response.status_code == 302
     # Register testuser
-    response = client.post(
+    response = isolated_client.post(
         "/auth/register",
         data={"username": "testuser", "password": "password"},
         follow_redirects=False,
@@ -46,7 +46,7 @@ def test_login_with_wrong_password(client: TestClient) -> None:
     assert response.status_code in [302, 409]
 
     # Login as testuser with bad password
-    response = client.post(
+    response = isolated_client.post(
         "/auth/login",
         data={"username": "testuser", "password": "BADDPASSWORD"},
         follow_redirects=False,
@@ -55,14 +55,14 @@ def test_login_with_wrong_password(client: TestClient) -> None:
     assert "Incorrect username/password." in response.text
 
 
-def test_unauth_index_with_users(client: TestClient) -> None:
-    client.post("/auth/register_owner", data={"password": "adminpassword"})
-    response = client.get("/", follow_redirects=False)
+def test_unauth_index_with_users(isolated_client: TestClient) -> None:
+    isolated_client.post("/auth/register_owner", data={"password": "adminpassword"})
+    response = isolated_client.get("/", follow_redirects=False)
     assert response.status_code in [302, 307]
     assert response.headers["location"].endswith("/auth/login")
 
 
-def test_unauth_index_no_users(client: TestClient) -> None:
-    response = client.get("/", follow_redirects=False)
+def test_unauth_index_no_users(isolated_client: TestClient) -> None:
+    response = isolated_client.get("/", follow_redirects=False)
     assert response.status_code in [302, 307]
     assert response.headers["location"].endswith("/auth/register_owner")
@@ -1,9 +1,31 @@
 """Tests for Supabase modules configuration and utilities."""
 
-from unittest.mock import patch, MagicMock
+import asyncio
+import re
+from collections.abc import Iterator
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from tronbyt_server.config import Settings, get_settings
-from tronbyt_server.supabase_client import is_supabase_enabled, _check_supabase_config
+import pytest
+
+from tronbyt_server.config import Settings
+from tronbyt_server.supabase_auth import SupabaseUser
+from tronbyt_server.supabase_client import (
+    _check_supabase_config,
+    _reset_cache,
+    is_supabase_enabled,
+)
+from tronbyt_server.ttl_cache import TTLCache
+
+
+class _SupabaseMock(MagicMock):
+    """MagicMock whose ``execute()`` calls are awaitable, like the async client."""
+
+    def _get_child_mock(self, **kw: Any) -> MagicMock:
+        if kw.get("name") == "execute":
+            return AsyncMock(**kw)
+        return _SupabaseMock(**kw)
 
 
 class TestSupabaseConfiguration:
@@ -27,92 +49,156 @@ class TestSupabaseConfiguration:
         assert settings.RATE_LIMIT_REQUESTS == 60
         assert settings.RATE_LIMIT_BURST == 10
 
-    @patch.dict(
-        "os.environ",
-        {
-            "AUTH_MODE": "supabase",
-            "SUPABASE_URL": "https://test.supabase.co",
-            "SUPABASE_ANON_KEY": "test-anon-key",
-            "SUPABASE_SERVICE_ROLE_KEY": "test-service-key",
-        },
-    )
-    def test_supabase_settings_from_env(self) -> None:
-        """Test that Supabase settings are read from environment."""
-        # Clear the cached settings
-        get_settings.cache_clear()
-        settings = Settings()
+    def test_supabase_settings_accept_values(self) -> None:
+        """Test that Settings accepts the Supabase fields."""
+        settings = Settings(
+            AUTH_MODE="supabase",
+            SUPABASE_URL="https://test.supabase.co",
+            SUPABASE_ANON_KEY="test-anon-key",
+            SUPABASE_SERVICE_ROLE_KEY="test-service-key",
+        )
         assert settings.AUTH_MODE == "supabase"
         assert settings.SUPABASE_URL == "https://test.supabase.co"
         assert settings.SUPABASE_ANON_KEY == "test-anon-key"
         assert settings.SUPABASE_SERVICE_ROLE_KEY == "test-service-key"
-        # Restore cached settings
-        get_settings.cache_clear()
+
+
+def _settings(**overrides: str) -> SimpleNamespace:
+    """Build a lightweight stand-in for the Settings object."""
+    values = {
+        "AUTH_MODE": "supabase",
+        "SUPABASE_URL": "https://test.supabase.co",
+        "SUPABASE_ANON_KEY": "test-key",
+    }
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _patch_settings(monkeypatch: pytest.MonkeyPatch, settings: SimpleNamespace) -> None:
+    monkeypatch.setattr("tronbyt_server.supabase_client.get_settings", lambda: settings)
+    # The configuration checks are cached, so start from a clean slate
+    _reset_cache()
 
 
 class TestSupabaseClientHelpers:
     """Tests for Supabase client helper functions."""
 
-    @patch("tronbyt_server.supabase_client.get_settings")
+    @pytest.fixture(autouse=True)
+    def reset_supabase_cache(self) -> Iterator[None]:
+        yield
+        _reset_cache()
+
+    def test_is_supabase_enabled_is_cached(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Test is_supabase_enabled only reads settings once."""
+        _patch_settings(monkeypatch, _settings())
+        assert is_supabase_enabled() is True
+
+        monkeypatch.setattr(
+            "tronbyt_server.supabase_client.get_settings",
+            lambda: _settings(AUTH_MODE="local"),
+        )
+        assert is_supabase_enabled() is True
+
     def test_is_supabase_enabled_false_when_local(
-        self, mock_get_settings: MagicMock
+        self, monkeypatch: pytest.MonkeyPatch
     ) -> None:
         """Test is_supabase_enabled returns False for local mode."""
-        mock_settings = MagicMock()
-        mock_settings.AUTH_MODE = "local"
-        mock_get_settings.return_value = mock_settings
+        _patch_settings(monkeypatch, _settings(AUTH_MODE="local"))
 
         assert is_supabase_enabled() is False
 
-    @patch("tronbyt_server.supabase_client.get_settings")
     def test_is_supabase_enabled_true_when_supabase(
-        self, mock_get_settings: MagicMock
+        self, monkeypatch: pytest.MonkeyPatch
     ) -> None:
         """Test is_supabase_enabled returns True for supabase mode."""
-        mock_settings = MagicMock()
-        mock_settings.AUTH_MODE = "supabase"
-        mock_get_settings.return_value = mock_settings
+        _patch_settings(monkeypatch, _settings())
 
         assert is_supabase_enabled() is True
 
-    @patch("tronbyt_server.supabase_client.get_settings")
     def test_check_supabase_config_false_when_missing_url(
-        self, mock_get_settings: MagicMock
+        self, monkeypatch: pytest.MonkeyPatch
     ) -> None:
         """Test _check_supabase_config returns False when URL is missing."""
-        mock_settings = MagicMock()
-        mock_settings.AUTH_MODE = "supabase"
-        mock_settings.SUPABASE_URL = ""
-        mock_settings.SUPABASE_ANON_KEY = "test-key"
-        mock_get_settings.return_value = mock_settings
+        _patch_settings(monkeypatch, _settings(SUPABASE_URL=""))
 
         assert _check_supabase_config() is False
 
-    @patch("tronbyt_server.supabase_client.get_settings")
     def test_check_supabase_config_false_when_missing_key(
-        self, mock_get_settings: MagicMock
+        self, monkeypatch: pytest.MonkeyPatch
     ) -> None:
         """Test _check_supabase_config returns False when anon key is missing."""
-        mock_settings = MagicMock()
-        mock_settings.AUTH_MODE = "supabase"
-        mock_settings.SUPABASE_URL = "https://test.supabase.co"
-        mock_settings.SUPABASE_ANON_KEY = ""
-        mock_get_settings.return_value = mock_settings
+        _patch_settings(monkeypatch, _settings(SUPABASE_ANON_KEY=""))
 
         assert _check_supabase_config() is False
 
-    @patch("tronbyt_server.supabase_client.get_settings")
     def test_check_supabase_config_true_when_configured(
-        self, mock_get_settings: MagicMock
+        self, monkeypatch: pytest.MonkeyPatch
     ) -> None:
         """Test _check_supabase_config returns True when properly configured."""
-        mock_settings = MagicMock()
-        mock_settings.AUTH_MODE = "supabase"
-        mock_settings.SUPABASE_URL = "https://test.supabase.co"
-        mock_settings.SUPABASE_ANON_KEY = "test-key"
-        mock_get_settings.return_value = mock_settings
+        _patch_settings(monkeypatch, _settings())
 
         assert _check_supabase_config() is True
 
+    @patch("supabase.AsyncClient")
+    def test_clients_share_one_http_pool(
+        self, mock_async_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Test the anon and admin clients reuse the same httpx client."""
+        from tronbyt_server.supabase_client import (
+            get_http_client,
+            get_supabase_admin_client,
+            get_supabase_client,
+        )
+
+        _patch_settings(monkeypatch, _settings(SUPABASE_SERVICE_ROLE_KEY="admin"))
+        get_supabase_client.cache_clear()
+        get_supabase_admin_client.cache_clear()
+        try:
+            get_supabase_client()
+            get_supabase_admin_client()
+        finally:
+            get_supabase_client.cache_clear()
+            get_supabase_admin_client.cache_clear()
+
+        pools = [
+            call.kwargs["options"].httpx_client
+            for call in mock_async_client.call_args_list
+        ]
+        assert pools == [get_http_client(), get_http_client()]
+
+    @patch("supabase.AsyncClient")
+    def test_closing_the_pool_drops_cached_clients(
+        self, mock_async_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Test clients built after close_http_client get a new pool."""
+        from tronbyt_server.supabase_client import (
+            close_http_client,
+            get_supabase_admin_client,
+            get_supabase_client,
+        )
+
+        _patch_settings(monkeypatch, _settings(SUPABASE_SERVICE_ROLE_KEY="admin"))
+        get_supabase_client.cache_clear()
+        get_supabase_admin_client.cache_clear()
+        try:
+            get_supabase_client()
+            get_supabase_admin_client()
+            asyncio.run(close_http_client())
+            get_supabase_client()
+        finally:
+            asyncio.run(close_http_client())
+
+        pools = [
+            call.kwargs["options"].httpx_client
+            for call in mock_async_client.call_args_list
+        ]
+        assert len(pools) == 3
+        assert pools[0] is pools[1]
+        assert pools[0].is_closed
+        assert pools[2] is not pools[0]
+
 
 class TestDeviceClaimValidation:
     """Tests for device claiming validation."""
@@ -142,6 +228,17 @@ class TestDeviceClaimValidation:
         assert validate_device_id("1234567Z") is False  # 'Z' not valid hex
         assert validate_device_id("12-45678") is False  # Dash not valid
         assert validate_device_id("12 45678") is False  # Space not valid
+        assert validate_device_id("1234_678") is False  # Underscore not valid
+        assert validate_device_id("+1234567") is False  # Sign not valid
+        assert validate_device_id(" 1234567") is False  # Leading space not valid
+
+
+def _request(
+    headers: dict[str, str] | None = None, host: str | None = None
+) -> SimpleNamespace:
+    """Build a lightweight stand-in for a FastAPI request."""
+    client = SimpleNamespace(host=host) if host is not None else None
+    return SimpleNamespace(headers=headers or {}, client=client)
 
 
 class TestRateLimitHelpers:
@@ -150,55 +247,1114 @@ class TestRateLimitHelpers:
     def test_get_rate_limit_key_from_client(self) -> None:
         """Test get_rate_limit_key extracts client IP."""
         from tronbyt_server.rate_limit import get_rate_limit_key
-        from unittest.mock import MagicMock
 
-        mock_request = MagicMock()
-        mock_request.headers.get.return_value = None
-        mock_request.client.host = "192.168.1.100"
-
-        key = get_rate_limit_key(mock_request)
+        key = get_rate_limit_key(_request(host="192.168.1.100"))  # type: ignore[arg-type]
         assert key == "192.168.1.100"
 
-    def test_get_rate_limit_key_from_forwarded_for(self) -> None:
+    def test_get_rate_limit_key_from_forwarded_for(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
         """Test get_rate_limit_key uses X-Forwarded-For header."""
         from tronbyt_server.rate_limit import get_rate_limit_key
-        from unittest.mock import MagicMock
 
-        mock_request = MagicMock()
-        mock_request.headers.get.side_effect = (
-            lambda key: "10.0.0.1, 192.168.1.1" if key == "X-Forwarded-For" else None
-        )
+        monkeypatch.setattr("tronbyt_server.rate_limit._TRUST_PROXY_HEADERS", True)
+        request = _request(headers={"X-Forwarded-For": "10.0.0.1, 192.168.1.1"})
 
-        key = get_rate_limit_key(mock_request)
-        assert key == "10.0.0.1"
+        key = get_rate_limit_key(request)  # type: ignore[arg-type]
+        assert key == "192.168.1.1"
 
-    def test_get_rate_limit_key_from_real_ip(self) -> None:
-        """Test get_rate_limit_key uses X-Real-IP header."""
+    def test_get_rate_limit_key_ignores_client_supplied_hops(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Test a spoofed X-Forwarded-For prefix doesn't change the key."""
         from tronbyt_server.rate_limit import get_rate_limit_key
-        from unittest.mock import MagicMock
 
-        mock_request = MagicMock()
+        monkeypatch.setattr("tronbyt_server.rate_limit._TRUST_PROXY_HEADERS", True)
+        requests = [
+            _request(headers={"X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"})
+            for i in range(3)
+        ]
 
-        def header_getter(key: str) -> str | None:
-            if key == "X-Forwarded-For":
-                return None
-            if key == "X-Real-IP":
-                return "203.0.113.50"
-            return None
+        keys = {get_rate_limit_key(request) for request in requests}  # type: ignore[arg-type]
+        assert keys == {"203.0.113.7"}
+
+    def test_get_rate_limit_key_from_real_ip(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Test get_rate_limit_key uses X-Real-IP header."""
+        from tronbyt_server.rate_limit import get_rate_limit_key
 
-        mock_request.headers.get.side_effect = header_getter
+        monkeypatch.setattr("tronbyt_server.rate_limit._TRUST_PROXY_HEADERS", True)
+        request = _request(headers={"X-Real-IP": "203.0.113.50"})
 
-        key = get_rate_limit_key(mock_request)
+        key = get_rate_limit_key(request)  # type: ignore[arg-type]
         assert key == "203.0.113.50"
 
+    def test_get_rate_limit_key_ignores_proxy_headers_by_default(self) -> None:
+        """Test get_rate_limit_key ignores proxy headers unless trusted."""
+        from tronbyt_server.rate_limit import get_rate_limit_key
+
+        request = _request(
+            headers={"X-Forwarded-For": "10.0.0.1", "X-Real-IP": "10.0.0.2"},
+            host="192.168.1.100",
+        )
+
+        key = get_rate_limit_key(request)  # type: ignore[arg-type]
+        assert key == "192.168.1.100"
+
     def test_get_rate_limit_key_fallback_unknown(self) -> None:
         """Test get_rate_limit_key falls back to 'unknown'."""
         from tronbyt_server.rate_limit import get_rate_limit_key
-        from unittest.mock import MagicMock
 
-        mock_request = MagicMock()
-        mock_request.headers.get.return_value = None
-        mock_request.client = None
-
-        key = get_rate_limit_key(mock_request)
+        key = get_rate_limit_key(_request())  # type: ignore[arg-type]
         assert key == "unknown"
+
+    def test_rate_limit_exceeded_handler_body(self) -> None:
+        """Test the 429 handler returns the rate limit JSON body."""
+        import json
+
+        from tronbyt_server.rate_limit import rate_limit_exceeded_handler
+
+        request = _request(host="192.168.1.100")
+        request.state = SimpleNamespace(
+            view_rate_limit=("limit", ["192.168.1.100", "scope"])
+        )
+        exc = SimpleNamespace(detail="60 per 1 minute")
+
+        response = rate_limit_exceeded_handler(request, exc)  # type: ignore[arg-type]
+
+        assert response.status_code == 429
+        assert response.media_type == "application/json"
+        assert json.loads(bytes(response.body)) == {
+            "error": "Rate limit exceeded",
+            "detail": "60 per 1 minute",
+            "retry_after": 60,
+        }
+
+
+class TestPairingTokenGeneration:
+    """Tests for pairing token generation."""
+
+    @patch(
+        "tronbyt_server.supabase_client.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_generate_pairing_token_uses_single_upsert(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        """Test generate_pairing_token replaces the token in one upsert."""
+        from tronbyt_server.device_claim import generate_pairing_token
+
+        table = mock_get_client.return_value.table.return_value
+        table.upsert.return_value.execute.return_value.data = [{"id": "1"}]
+
+        token = asyncio.run(generate_pairing_token("abcdef12"))
+
+        assert token.device_id == "abcdef12"
+        table.delete.assert_not_called()
+        row = table.upsert.call_args.args[0]
+        assert row["token"] == token.token
+        assert row["claimed_by"] is None
+        assert table.upsert.call_args.kwargs["on_conflict"] == "device_id"
+
+    @patch(
+        "tronbyt_server.supabase_client.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_generate_pairing_tokens_bulk_single_upsert(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        """Test bulk generation writes every token in one upsert."""
+        from tronbyt_server.device_claim import generate_pairing_tokens_bulk
+
+        table = mock_get_client.return_value.table.return_value
+        table.upsert.return_value.execute.return_value.data = [{}, {}]
+
+        tokens = asyncio.run(generate_pairing_tokens_bulk(["abcdef12", "12345678"]))
+
+        assert [t.device_id for t in tokens] == ["abcdef12", "12345678"]
+        assert len({t.token for t in tokens}) == 2
+        assert all(len(t.token) == 43 for t in tokens)
+        table.upsert.assert_called_once()
+        rows = table.upsert.call_args.args[0]
+        assert [r["token"] for r in rows] == [t.token for t in tokens]
+
+    @patch(
+        "tronbyt_server.supabase_client.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_generate_pairing_tokens_bulk_collapses_duplicates(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        """Test a repeated device ID is only upserted once."""
+        from tronbyt_server.device_claim import generate_pairing_tokens_bulk
+
+        table = mock_get_client.return_value.table.return_value
+        table.upsert.return_value.execute.return_value.data = [{}, {}]
+
+        tokens = asyncio.run(
+            generate_pairing_tokens_bulk(["abcdef12", "12345678", "abcdef12"])
+        )
+
+        assert [t.device_id for t in tokens] == ["abcdef12", "12345678"]
+        rows = table.upsert.call_args.args[0]
+        assert [r["device_id"] for r in rows] == ["abcdef12", "12345678"]
+
+    def test_generate_pairing_tokens_bulk_rejects_oversized_batch(self) -> None:
+        """Test bulk generation refuses more than the batch limit."""
+        from fastapi import HTTPException
+
+        from tronbyt_server.device_claim import (
+            PAIRING_TOKENS_BULK_LIMIT,
+            generate_pairing_tokens_bulk,
+        )
+
+        device_ids = [f"{i:08x}" for i in range(PAIRING_TOKENS_BULK_LIMIT + 1)]
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(generate_pairing_tokens_bulk(device_ids))
+        assert exc_info.value.status_code == 400
+
+    def test_generate_pairing_tokens_bulk_rejects_invalid_id(self) -> None:
+        """Test bulk generation validates every device ID."""
+        from fastapi import HTTPException
+
+        from tronbyt_server.device_claim import generate_pairing_tokens_bulk
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(generate_pairing_tokens_bulk(["abcdef12", "nothex!!"]))
+        assert exc_info.value.status_code == 400
+
+
+class TestDeviceClaim:
+    """Tests for device claiming."""
+
+    @patch(
+        "tronbyt_server.supabase_client.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_claim_device_uses_rpc(self, mock_get_client: MagicMock) -> None:
+        """Test claim_device delegates to the claim_device RPC."""
+        from tronbyt_server.device_claim import claim_device
+
+        supabase = mock_get_client.return_value
+        supabase.rpc.return_value.execute.return_value.data = [
+            {
+                "success": True,
+                "device_id": "abcdef12",
+                "message": "Device claimed successfully",
+            }
+        ]
+
+        result = asyncio.run(claim_device("user-1", "pairing-token"))
+
+        assert result.success is True
+        assert result.device_id == "abcdef12"
+        supabase.rpc.assert_called_once_with(
+            "claim_device", {"p_user_id": "user-1", "p_token": "pairing-token"}
+        )
+        supabase.table.assert_not_called()
+
+    @patch(
+        "tronbyt_server.supabase_client.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_claim_device_rejected(self, mock_get_client: MagicMock) -> None:
+        """Test claim_device surfaces a rejection from the RPC."""
+        from tronbyt_server.device_claim import claim_device
+
+        supabase = mock_get_client.return_value
+        supabase.rpc.return_value.execute.return_value.data = [
+            {
+                "success": False,
+                "device_id": None,
+                "message": "Invalid or expired pairing token",
+            }
+        ]
+
+        result = asyncio.run(claim_device("user-1", "stale-token"))
+
+        assert result.success is False
+        assert result.device_id is None
+        assert result.message == "Invalid or expired pairing token"
+
+
+class TestPendingDevices:
+    """Tests for listing devices awaiting a claim."""
+
+    @patch(
+        "tronbyt_server.supabase_client.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_get_pending_devices_is_bounded(self, mock_get_client: MagicMock) -> None:
+        """Test get_pending_devices orders by expiry and caps the result."""
+        from tronbyt_server.device_claim import (
+            PENDING_DEVICES_LIMIT,
+            get_pending_devices,
+        )
+
+        query = mock_get_client.return_value.table.return_value.select.return_value
+        query = query.is_.return_value.gt.return_value
+        ordered = query.order.return_value.order.return_value
+        ordered.limit.return_value.execute.return_value.data = [
+            {"device_id": "abcdef12"}
+        ]
+
+        assert asyncio.run(get_pending_devices("user-1")) == [{"device_id": "abcdef12"}]
+        query.order.assert_called_once_with("expires_at")
+        query.order.return_value.order.assert_called_once_with("device_id")
+        ordered.limit.assert_called_once_with(PENDING_DEVICES_LIMIT)
+
+    def test_pages_do_not_skip_tokens_sharing_an_expiry(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Test the keyset cursor walks a bulk batch with one expires_at."""
+        from tronbyt_server.device_claim import (
+            PENDING_DEVICES_LIMIT,
+            get_pending_devices,
+        )
+
+        expires_at = "2030-01-01T00:00:00+00:00"
+        rows = [
+            {"device_id": f"{i:08x}", "expires_at": expires_at}
+            for i in range(PENDING_DEVICES_LIMIT * 2 + 50)
+        ]
+        monkeypatch.setattr(
+            "tronbyt_server.supabase_client.get_supabase_admin_client",
+            lambda: _FakePendingTokens(rows),
+        )
+
+        seen: list[str] = []
+        since: tuple[str, str] | None = None
+        while page := asyncio.run(get_pending_devices("user-1", since)):
+            seen += [row["device_id"] for row in page]
+            since = (page[-1]["expires_at"], page[-1]["device_id"])
+
+        assert seen == [row["device_id"] for row in rows]
+
+    def test_malformed_cursor_is_rejected(self) -> None:
+        """Test cursor values are validated before reaching the filter."""
+        from fastapi import HTTPException
+
+        from tronbyt_server.device_claim import get_pending_devices
+
+        for since in (("not-a-date", "abcdef12"), ("2030-01-01", "x),or(a.eq.1")):
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(get_pending_devices("user-1", since))
+            assert exc_info.value.status_code == 400
+
+
+class _FakePendingTokens:
+    """In-memory stand-in for the device_pairing_tokens query chain.
+
+    Applies the keyset ``or_`` filter built by get_pending_devices, so
+    pagination can be checked end to end.
+    """
+
+    _CURSOR = re.compile(
+        r'expires_at\.gt\."(?P<at>[^"]+)",'
+        r'and\(expires_at\.eq\."(?P=at)",device_id\.gt\.(?P<id>\w+)\)'
+    )
+
+    def __init__(self, rows: list[dict[str, str]]) -> None:
+        self._rows = rows
+        self._cursor: tuple[str, str] | None = None
+        self._limit = len(rows)
+
+    def _chain(self, *args: Any, **kwargs: Any) -> "_FakePendingTokens":
+        return self
+
+    table = select = is_ = gt = order = _chain
+
+    def or_(self, filters: str) -> "_FakePendingTokens":
+        match = self._CURSOR.fullmatch(filters)
+        assert match is not None
+        self._cursor = (match["at"], match["id"])
+        return self
+
+    def limit(self, limit: int) -> "_FakePendingTokens":
+        self._limit = limit
+        return self
+
+    async def execute(self) -> SimpleNamespace:
+        rows = sorted(self._rows, key=lambda r: (r["expires_at"], r["device_id"]))
+        if self._cursor:
+            rows = [r for r in rows if (r["expires_at"], r["device_id"]) > self._cursor]
+        return SimpleNamespace(data=rows[: self._limit])
+
+
+_JWT_SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+
+def _jwt(exp: float, secret: str = _JWT_SECRET, **claims: Any) -> str:
+    """Build an HS256 Supabase-style access token."""
+    import jwt
+
+    payload = {"sub": "user-1", "aud": "authenticated", "exp": exp, **claims}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+class TestCurrentUserCache:
+    """Tests for caching verified users in get_current_user."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self) -> Iterator[None]:
+        from tronbyt_server.supabase_auth import _rejected_tokens, _user_cache
+
+        _user_cache.clear()
+        _rejected_tokens.clear()
+        yield
+        _user_cache.clear()
+        _rejected_tokens.clear()
+
+    @staticmethod
+    def _authenticate(token: str) -> SupabaseUser | None:
+        from tronbyt_server.supabase_auth import get_current_user
+
+        request = SimpleNamespace(method="GET", cookies={"sb-access-token": token})
+        return asyncio.run(get_current_user(request, None))  # type: ignore[arg-type]
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_client", new_callable=_SupabaseMock
+    )
+    def test_verified_user_is_cached(self, mock_get_client: MagicMock) -> None:
+        import time
+
+        rpc = mock_get_client.return_value.rpc
+        rpc.return_value.execute.return_value.data = {
+            "id": "user-1",
+            "email": "a@example.com",
+            "username": "alice",
+        }
+
+        token = _jwt(time.time() + 3600)
+        first = self._authenticate(token)
+        second = self._authenticate(token)
+
+        assert first is second
+        assert first is not None
+        assert first.username == "alice"
+        rpc.assert_called_once_with("get_user_with_profile", {})
+        rpc.return_value.request.headers.__setitem__.assert_called_once_with(
+            "Authorization", f"Bearer {token}"
+        )
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_client", new_callable=_SupabaseMock
+    )
+    def test_failed_and_expired_tokens_are_not_cached(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        import time
+
+        rpc = mock_get_client.return_value.rpc
+        rpc.return_value.execute.return_value.data = None
+
+        token = _jwt(time.time() + 3600)
+        assert self._authenticate(token) is None
+        assert self._authenticate(token) is None
+        assert rpc.call_count == 2
+
+        rpc.return_value.execute.return_value.data = {"id": "user-1"}
+        expired = _jwt(time.time() - 1)
+        self._authenticate(expired)
+        self._authenticate(expired)
+        assert rpc.call_count == 4
+
+
+class TestDeviceOwnership:
+    """Tests for validate_device_ownership."""
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_client", new_callable=_SupabaseMock
+    )
+    def test_ownership_uses_count_only_query(self, mock_get_client: MagicMock) -> None:
+        from postgrest.types import CountMethod
+
+        from tronbyt_server.supabase_auth import validate_device_ownership
+
+        table = mock_get_client.return_value.table.return_value
+        query = table.select.return_value.eq.return_value.eq.return_value
+        query.execute.return_value.count = 1
+
+        assert asyncio.run(validate_device_ownership("user-1", "abcdef12")) is True
+        table.select.assert_called_once_with("id", count=CountMethod.exact, head=True)
+
+        query.execute.return_value.count = 0
+        assert asyncio.run(validate_device_ownership("user-1", "abcdef12")) is False
+
+
+class TestLocalTokenVerification:
+    """Tests for verifying access tokens without calling Supabase."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self, monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+        from tronbyt_server.supabase_auth import _user_cache
+
+        monkeypatch.setattr(
+            "tronbyt_server.supabase_auth.get_settings",
+            lambda: _settings(SUPABASE_JWT_SECRET=_JWT_SECRET),
+        )
+        _user_cache.clear()
+        yield
+        _user_cache.clear()
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_user_profile",
+        new_callable=AsyncMock,
+        return_value={"id": "user-1", "username": "alice"},
+    )
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_client", new_callable=_SupabaseMock
+    )
+    def test_hs256_token_is_verified_locally(
+        self, mock_get_client: MagicMock, mock_get_profile: AsyncMock
+    ) -> None:
+        import time
+
+        token = _jwt(time.time() + 3600, email="a@example.com")
+        user = TestCurrentUserCache._authenticate(token)
+
+        assert user is not None
+        assert user.username == "alice"
+        assert user.email == "a@example.com"
+        mock_get_profile.assert_awaited_once_with("user-1")
+        mock_get_client.return_value.rpc.assert_not_called()
+
+    @patch("tronbyt_server.supabase_auth.get_user_profile", new_callable=AsyncMock)
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_client", new_callable=_SupabaseMock
+    )
+    def test_forged_and_expired_tokens_are_rejected_locally(
+        self, mock_get_client: MagicMock, mock_get_profile: AsyncMock
+    ) -> None:
+        import time
+
+        assert (
+            TestCurrentUserCache._authenticate(_jwt(time.time() + 3600, "x" * 32))
+            is None
+        )
+        assert TestCurrentUserCache._authenticate(_jwt(time.time() - 60)) is None
+        assert TestCurrentUserCache._authenticate("not-a-jwt") is None
+        mock_get_profile.assert_not_called()
+        mock_get_client.return_value.rpc.assert_not_called()
+
+    def test_rejected_token_is_not_verified_again(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        import time
+
+        import jwt
+
+        from tronbyt_server import supabase_auth
+
+        verify = AsyncMock(side_effect=jwt.InvalidSignatureError())
+        monkeypatch.setattr(supabase_auth, "_verify_token_locally", verify)
+        monkeypatch.setattr(supabase_auth, "_rejected_tokens", TTLCache(10, 10))
+
+        forged = _jwt(time.time() + 3600, "x" * 32)
+        assert TestCurrentUserCache._authenticate(forged) is None
+        assert TestCurrentUserCache._authenticate(forged) is None
+        verify.assert_awaited_once()
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_client", new_callable=_SupabaseMock
+    )
+    def test_preflight_and_anonymous_requests_skip_verification(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_auth import get_current_user
+
+        preflight = SimpleNamespace(method="OPTIONS", cookies={"sb-access-token": "x"})
+        anonymous = SimpleNamespace(method="GET", cookies={})
+
+        assert asyncio.run(get_current_user(preflight, None)) is None  # type: ignore[arg-type]
+        assert asyncio.run(get_current_user(anonymous, None)) is None  # type: ignore[arg-type]
+        mock_get_client.assert_not_called()
+
+
+class TestApiKeyAuth:
+    """Tests for API key authentication."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self) -> Iterator[None]:
+        from tronbyt_server.supabase_auth import _api_key_cache
+
+        _api_key_cache.clear()
+        yield
+        _api_key_cache.clear()
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_api_token_resolves_user_and_device_in_one_call(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_auth import get_user_and_device_from_api_key
+        from tronbyt_server.supabase_db import hash_api_key
+
+        supabase = mock_get_client.return_value
+        supabase.rpc.return_value.execute.return_value.data = {
+            "profile": {"id": "user-1", "username": "alice"},
+            "device": {"id": "abcdef12"},
+        }
+        credentials = SimpleNamespace(credentials="api-key")
+
+        user, device = asyncio.run(
+            get_user_and_device_from_api_key("abcdef12", credentials)  # type: ignore[arg-type]
+        )
+
+        assert user is not None and user.id == "user-1"
+        assert device == {"id": "abcdef12"}
+        supabase.rpc.assert_called_once_with(
+            "get_user_by_api_token",
+            {"p_token_hash": hash_api_key("api-key"), "p_device_id": "abcdef12"},
+        )
+        supabase.table.assert_not_called()
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_api_key_lookup_is_cached_until_the_token_is_deleted(
+        self, mock_get_admin: MagicMock, mock_get_client: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_auth import get_user_and_device_from_api_key
+        from tronbyt_server.supabase_db import delete_api_token, hash_api_key
+
+        rpc = mock_get_admin.return_value.rpc
+        rpc.return_value.execute.return_value.data = {
+            "profile": {"id": "user-1", "username": "alice"},
+            "device": {"id": "abcdef12"},
+        }
+        credentials = SimpleNamespace(credentials="api-key")
+
+        def authenticate() -> dict[str, Any] | None:
+            user, device = asyncio.run(
+                get_user_and_device_from_api_key("abcdef12", credentials)  # type: ignore[arg-type]
+            )
+            assert user is not None and user.id == "user-1"
+            return device
+
+        for _ in range(2):
+            device = authenticate()
+            assert device == {"id": "abcdef12"}
+            device["id"] = "changed"
+        assert rpc.call_count == 1
+
+        delete = mock_get_client.return_value.table.return_value.delete.return_value
+        delete.eq.return_value.eq.return_value.execute.return_value.data = [
+            {"token_hash": hash_api_key("api-key")}
+        ]
+        assert asyncio.run(delete_api_token("user-1", "token-1")) is True
+
+        authenticate()
+        assert rpc.call_count == 2
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_unknown_api_key_is_rejected_from_cache(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from fastapi import HTTPException
+
+        from tronbyt_server import supabase_auth
+
+        monkeypatch.setattr(supabase_auth, "_rejected_tokens", TTLCache(10, 10))
+        supabase = mock_get_client.return_value
+        supabase.rpc.return_value.execute.return_value.data = None
+        credentials = SimpleNamespace(credentials="wrong-key")
+
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(
+                    supabase_auth.get_user_and_device_from_api_key(
+                        "abcdef12",
+                        credentials,  # type: ignore[arg-type]
+                    )
+                )
+            assert exc_info.value.status_code == 401
+        # Token and device key lookups, for the first attempt only
+        assert [call.args[0] for call in supabase.rpc.call_args_list] == [
+            "get_user_by_api_token",
+            "get_device_by_api_key",
+        ]
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_last_used_is_flushed_in_one_batch(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from datetime import UTC, datetime
+
+        from tronbyt_server import supabase_auth
+
+        used_at = datetime(2024, 1, 1, tzinfo=UTC)
+        monkeypatch.setattr(
+            supabase_auth, "_pending_last_used", {"key-1": used_at, "key-2": used_at}
+        )
+
+        asyncio.run(supabase_auth.flush_token_last_used())
+
+        mock_get_client.return_value.rpc.assert_called_once_with(
+            "touch_api_tokens",
+            {
+                "p_token_hashes": ["key-1", "key-2"],
+                "p_used_at": [used_at.isoformat(), used_at.isoformat()],
+            },
+        )
+        assert supabase_auth._pending_last_used == {}
+
+    @patch(
+        "tronbyt_server.supabase_auth.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_cancelled_flush_keeps_last_used(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from datetime import UTC, datetime
+
+        from tronbyt_server import supabase_auth
+
+        used_at = datetime(2024, 1, 1, tzinfo=UTC)
+        monkeypatch.setattr(supabase_auth, "_pending_last_used", {"key-1": used_at})
+        mock_get_client.return_value.rpc.return_value.execute.side_effect = (
+            asyncio.CancelledError
+        )
+
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(supabase_auth.flush_token_last_used())
+        assert supabase_auth._pending_last_used == {"key-1": used_at}
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_created_api_token_is_stored_hashed(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_db import create_api_token, hash_api_key
+
+        table = mock_get_client.return_value.table.return_value
+        table.insert.return_value.execute.return_value.data = [{"name": "Default"}]
+
+        token = asyncio.run(create_api_token("user-1"))
+
+        assert token is not None
+        row = table.insert.call_args.args[0]
+        assert "token" not in row
+        assert row["token_hash"] == hash_api_key(token["token"])
+        assert row["token_prefix"] == token["token"][:8]
+
+    @patch(
+        "tronbyt_server.supabase_db.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_user_by_api_key_is_one_rpc(self, mock_get_admin: MagicMock) -> None:
+        from tronbyt_server import supabase_db
+
+        rpc = mock_get_admin.return_value.rpc
+        rpc.return_value.execute.return_value.data = {"profile": {"id": "user-1"}}
+
+        profile = asyncio.run(supabase_db.get_user_by_api_key("api-key"))
+
+        assert profile == {"id": "user-1"}
+        rpc.assert_called_once_with(
+            "get_user_by_api_token",
+            {"p_token_hash": supabase_db.hash_api_key("api-key")},
+        )
+
+
+class TestUserProfileCache:
+    """Tests for the cached user profile lookup."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self) -> Iterator[None]:
+        from tronbyt_server.supabase_db import _profile_cache
+
+        _profile_cache.clear()
+        yield
+        _profile_cache.clear()
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    @patch(
+        "tronbyt_server.supabase_db.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_profile_is_cached_until_updated(
+        self, mock_get_admin: MagicMock, mock_get_client: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_db import get_user_profile, update_user_profile
+
+        query = mock_get_admin.return_value.table.return_value.select.return_value
+        execute = query.eq.return_value.maybe_single.return_value.execute
+        execute.return_value.data = {"id": "user-1", "username": "alice"}
+
+        assert asyncio.run(get_user_profile("user-1")) == {
+            "id": "user-1",
+            "username": "alice",
+        }
+        assert asyncio.run(get_user_profile("user-1")) == {
+            "id": "user-1",
+            "username": "alice",
+        }
+        assert execute.call_count == 1
+
+        assert asyncio.run(update_user_profile("user-1", {"username": "bob"})) is True
+        execute.return_value.data = {"id": "user-1", "username": "bob"}
+        assert asyncio.run(get_user_profile("user-1")) == {
+            "id": "user-1",
+            "username": "bob",
+        }
+        assert execute.call_count == 2
+
+    @patch(
+        "tronbyt_server.supabase_db.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_cached_profile_is_not_shared_with_callers(
+        self, mock_get_admin: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_db import get_user_profile
+
+        query = mock_get_admin.return_value.table.return_value.select.return_value
+        execute = query.eq.return_value.maybe_single.return_value.execute
+        execute.return_value.data = {"id": "user-1", "settings": {"theme": "dark"}}
+
+        for _ in range(2):
+            profile = asyncio.run(get_user_profile("user-1"))
+            assert profile == {"id": "user-1", "settings": {"theme": "dark"}}
+            profile["settings"]["theme"] = "light"
+
+    @patch(
+        "tronbyt_server.supabase_db.get_supabase_admin_client",
+        new_callable=_SupabaseMock,
+    )
+    def test_missing_profile_is_not_an_error(
+        self, mock_get_admin: MagicMock, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        from tronbyt_server.supabase_db import get_user_profile
+
+        query = mock_get_admin.return_value.table.return_value.select.return_value
+        query.eq.return_value.maybe_single.return_value.execute.return_value = None
+
+        assert asyncio.run(get_user_profile("missing")) is None
+        assert "Failed to get user profile" not in caplog.text
+
+
+class TestAppInstallations:
+    """Tests for app installation writes."""
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_save_app_installations_uses_single_upsert(
+        self, mock_get_client: MagicMock
+    ) -> None:
+        from tronbyt_server.supabase_db import save_app_installations
+
+        table = mock_get_client.return_value.table.return_value
+        apps = [{"iname": "clock"}, {"iname": "weather"}]
+
+        assert asyncio.run(save_app_installations("user-1", "abcdef12", apps)) is True
+        table.upsert.assert_called_once_with(
+            [
+                {"iname": "clock", "user_id": "user-1", "device_id": "abcdef12"},
+                {"iname": "weather", "user_id": "user-1", "device_id": "abcdef12"},
+            ],
+            on_conflict="device_id,iname",
+        )
+        assert apps == [{"iname": "clock"}, {"iname": "weather"}]
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_save_app_installations_batches_large_lists(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "APP_WRITE_BATCH_SIZE", 2)
+        table = mock_get_client.return_value.table.return_value
+        apps: list[dict[str, Any]] = [
+            {"iname": "clock", "enabled": True},
+            {"iname": "weather"},
+            {"iname": "clock", "enabled": False},
+            {"iname": "news"},
+        ]
+
+        assert asyncio.run(
+            supabase_db.save_app_installations("user-1", "abcdef12", apps)
+        )
+        batches = [
+            [row["iname"] for row in call.args[0]]
+            for call in table.upsert.call_args_list
+        ]
+        assert batches == [["clock", "weather"], ["news"]]
+        assert table.upsert.call_args_list[0].args[0][0]["enabled"] is False
+        assert all(
+            call.kwargs == {"on_conflict": "device_id,iname"}
+            for call in table.upsert.call_args_list
+        )
+        table.delete.assert_not_called()
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_missing_app_installation_is_cached_until_saved(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_app_installation_cache", TTLCache(10, 5))
+        select = mock_get_client.return_value.table.return_value.select
+        query = select.return_value.eq.return_value.eq.return_value.eq.return_value
+        execute = query.maybe_single.return_value.execute
+        execute.return_value = None
+
+        for _ in range(2):
+            assert (
+                asyncio.run(
+                    supabase_db.get_app_installation("user-1", "abcdef12", "clock")
+                )
+                is None
+            )
+        assert execute.call_count == 1
+
+        asyncio.run(
+            supabase_db.save_app_installation("user-1", "abcdef12", {"iname": "clock"})
+        )
+        execute.return_value = MagicMock(data={"iname": "clock"})
+        assert asyncio.run(
+            supabase_db.get_app_installation("user-1", "abcdef12", "clock")
+        ) == {"iname": "clock"}
+        assert execute.call_count == 2
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_cached_app_installation_is_not_shared_with_callers(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_app_installation_cache", TTLCache(10, 5))
+        select = mock_get_client.return_value.table.return_value.select
+        query = select.return_value.eq.return_value.eq.return_value.eq.return_value
+        query.maybe_single.return_value.execute.return_value = MagicMock(
+            data={"iname": "clock", "config": {"color": "red"}}
+        )
+
+        for _ in range(2):
+            app = asyncio.run(
+                supabase_db.get_app_installation("user-1", "abcdef12", "clock")
+            )
+            assert app == {"iname": "clock", "config": {"color": "red"}}
+            app["config"]["color"] = "blue"
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_queued_writes_are_coalesced_and_flushed_together(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_pending_app_writes", {})
+        supabase_db.queue_app_installation_save(
+            "user-1", "abcdef12", {"iname": "clock", "enabled": True}
+        )
+        supabase_db.queue_app_installation_save(
+            "user-1", "abcdef12", {"iname": "clock", "enabled": False}
+        )
+        supabase_db.queue_app_installation_delete("user-1", "abcdef12", "weather")
+
+        asyncio.run(supabase_db.flush_app_installations())
+
+        table = mock_get_client.return_value.table.return_value
+        table.upsert.assert_called_once_with(
+            [
+                {
+                    "iname": "clock",
+                    "enabled": False,
+                    "user_id": "user-1",
+                    "device_id": "abcdef12",
+                }
+            ],
+            on_conflict="device_id,iname",
+        )
+        delete = table.delete.return_value.eq.return_value.eq.return_value
+        delete.in_.assert_called_once_with("iname", ["weather"])
+        assert supabase_db._pending_app_writes == {}
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_failed_queued_writes_are_retried_then_dropped(
+        self,
+        mock_get_client: MagicMock,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_pending_app_writes", {})
+        monkeypatch.setattr(supabase_db, "_app_write_failures", {})
+        upsert = mock_get_client.return_value.table.return_value.upsert
+        upsert.return_value.execute.side_effect = RuntimeError("bad row")
+        supabase_db.queue_app_installation_save(
+            "user-1", "abcdef12", {"iname": "clock"}
+        )
+
+        for _ in range(supabase_db.APP_WRITE_MAX_ATTEMPTS - 1):
+            asyncio.run(supabase_db.flush_app_installations())
+            assert list(supabase_db._pending_app_writes) == [
+                ("user-1", "abcdef12", "clock")
+            ]
+        asyncio.run(supabase_db.flush_app_installations())
+
+        assert supabase_db._pending_app_writes == {}
+        assert supabase_db._app_write_failures == {}
+        assert upsert.call_count == supabase_db.APP_WRITE_MAX_ATTEMPTS
+        assert "Dropping app installation writes" in caplog.text
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_queued_writes_survive_a_cancelled_flush(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_pending_app_writes", {})
+        app_data = {"iname": "clock", "enabled": True}
+        supabase_db.queue_app_installation_save("user-1", "abcdef12", app_data)
+        app_data["enabled"] = False
+        upsert = mock_get_client.return_value.table.return_value.upsert
+        upsert.return_value.execute.side_effect = asyncio.CancelledError
+
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(supabase_db.flush_app_installations())
+        assert supabase_db._pending_app_writes == {
+            ("user-1", "abcdef12", "clock"): {"iname": "clock", "enabled": True}
+        }
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_apps_for_several_devices_use_one_query(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+        from tronbyt_server.supabase_db import get_device_apps_for_devices
+
+        monkeypatch.setattr(supabase_db, "_device_apps_cache", TTLCache(10, 5))
+        select = mock_get_client.return_value.table.return_value.select
+        query = select.return_value.eq.return_value.in_.return_value.order.return_value
+        query.execute.return_value.data = [
+            {"device_id": "abcdef12", "iname": "clock"},
+            {"device_id": "abcdef12", "iname": "weather"},
+        ]
+
+        apps = asyncio.run(
+            get_device_apps_for_devices("user-1", ["abcdef12", "12345678"])
+        )
+
+        assert apps == {
+            "abcdef12": [{"iname": "clock"}, {"iname": "weather"}],
+            "12345678": [],
+        }
+        select.return_value.eq.return_value.in_.assert_called_once_with(
+            "device_id", ["abcdef12", "12345678"]
+        )
+        query.execute.assert_awaited_once()
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_apps_for_several_devices_fetch_only_uncached(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_device_apps_cache", TTLCache(10, 5))
+        supabase_db._device_apps_cache.set(("user-1", "abcdef12"), [{"iname": "clock"}])
+        select = mock_get_client.return_value.table.return_value.select
+        in_ = select.return_value.eq.return_value.in_
+        query = in_.return_value.order.return_value
+        query.execute.return_value.data = [
+            {"device_id": "12345678", "iname": "weather"},
+        ]
+
+        for _ in range(2):
+            apps = asyncio.run(
+                supabase_db.get_device_apps_for_devices(
+                    "user-1", ["abcdef12", "12345678"]
+                )
+            )
+            assert apps == {
+                "abcdef12": [{"iname": "clock"}],
+                "12345678": [{"iname": "weather"}],
+            }
+            apps["abcdef12"].clear()
+        in_.assert_called_once_with("device_id", ["12345678"])
+        query.execute.assert_awaited_once()
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_device_apps_are_cached_until_an_app_is_deleted(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_device_apps_cache", TTLCache(10, 5))
+        select = mock_get_client.return_value.table.return_value.select
+        query = select.return_value.eq.return_value.eq.return_value.order.return_value
+        query.execute.return_value.data = [{"iname": "clock"}]
+
+        for _ in range(2):
+            assert asyncio.run(supabase_db.get_device_apps("user-1", "abcdef12")) == [
+                {"iname": "clock"}
+            ]
+        assert query.execute.await_count == 1
+
+        asyncio.run(supabase_db.delete_app_installation("user-1", "abcdef12", "clock"))
+        query.execute.return_value.data = []
+        assert asyncio.run(supabase_db.get_device_apps("user-1", "abcdef12")) == []
+        assert query.execute.await_count == 2
+
+    @patch("tronbyt_server.supabase_db.get_supabase_client", new_callable=_SupabaseMock)
+    def test_cached_device_apps_are_not_shared_with_callers(
+        self, mock_get_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from tronbyt_server import supabase_db
+
+        monkeypatch.setattr(supabase_db, "_device_apps_cache", TTLCache(10, 5))
+        select = mock_get_client.return_value.table.return_value.select
+        query = select.return_value.eq.return_value.eq.return_value.order.return_value
+        query.execute.return_value.data = [{"iname": "clock", "enabled": True}]
+
+        for _ in range(2):
+            apps = asyncio.run(supabase_db.get_device_apps("user-1", "abcdef12"))
+            assert apps == [{"iname": "clock", "enabled": True}]
+            apps[0]["enabled"] = False
+            apps.append({"iname": "weather"})
+
+
+class TestLoginEndpoint:
+    """Tests for the Supabase login endpoint."""
+
+    @patch("tronbyt_server.routers.supabase_auth.get_supabase_client")
+    def test_login_sets_session_cookie(self, mock_get_client: MagicMock) -> None:
+        from tronbyt_server.routers.supabase_auth import LoginRequest, login
+
+        session = SimpleNamespace(
+            access_token="access", refresh_token="refresh", expires_in=3600
+        )
+        mock_get_client.return_value.auth.sign_in_with_password = AsyncMock(
+            return_value=SimpleNamespace(session=session)
+        )
+
+        response = asyncio.run(
+            login(LoginRequest(email="a@example.com", password="pw"))
+        )
+
+        assert response.status_code == 200
+        assert "sb-access-token=access" in response.headers["set-cookie"]
+
+    @patch("tronbyt_server.routers.supabase_auth.get_supabase_client")
+    def test_login_failure_is_unauthorized(self, mock_get_client: MagicMock) -> None:
+        from fastapi import HTTPException
+
+        from tronbyt_server.routers.supabase_auth import LoginRequest, login
+
+        mock_get_client.return_value.auth.sign_in_with_password = AsyncMock(
+            side_effect=RuntimeError("invalid login")
+        )
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(login(LoginRequest(email="a@example.com", password="bad")))
+        assert exc_info.value.status_code == 401
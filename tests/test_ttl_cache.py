@@ -0,0 +1,83 @@
+"""Tests for the TTL cache."""
+
+import pytest
+
+from tronbyt_server.ttl_cache import TTLCache
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr("time.monotonic", clock)
+    return clock
+
+
+def test_get_returns_value_until_expiry(clock: _Clock) -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    clock.now += 30
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_per_entry_ttl_is_capped_by_default(clock: _Clock) -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=30)
+    cache.set("short", 1, ttl=5)
+    cache.set("long", 2, ttl=300)
+
+    clock.now += 10
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+    clock.now += 20
+    assert cache.get("long") is None
+
+
+def test_non_positive_ttl_is_not_stored(clock: _Clock) -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=30)
+    cache.set("expired", 1, ttl=0)
+    assert "expired" not in cache
+
+
+def test_least_recently_used_entry_is_evicted(clock: _Clock) -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_pop_and_clear(clock: _Clock) -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    cache.clear()
+    assert cache.get("b") is None
+
+
+def test_pop_where(clock: _Clock) -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=30)
+    cache.set("key-1:abcdef12", 1)
+    cache.set("key-1:12345678", 2)
+    cache.set("key-2:abcdef12", 3)
+
+    assert cache.pop_where(lambda key: key.startswith("key-1:")) == 2
+    assert len(cache) == 1
+    assert cache.get("key-2:abcdef12") == 3
@@ -0,0 +1,103 @@
+"""A circuit breaker for httpx transports.
+
+Wraps the transport under the shared Supabase HTTP pool so that, while
+Supabase is down, requests fail immediately instead of each one waiting
+for its own timeout and retries.
+
+Usage:
+    import httpx
+    from tronbyt_server.circuit_breaker import CircuitBreakerTransport
+
+    transport = CircuitBreakerTransport(
+        httpx.AsyncHTTPTransport(), failure_threshold=10, reset_timeout=30
+    )
+    client = httpx.AsyncClient(transport=transport)
+"""
+
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while the circuit is open."""
+
+
+def _is_outage(response: httpx.Response) -> bool:
+    """Whether a response means the upstream itself is unavailable.
+
+    Gateway errors (502-504) and Cloudflare's 52x codes count; other 5xx
+    responses usually come from one bad request, not an outage.
+    """
+    return response.status_code in (502, 503, 504) or 520 <= response.status_code < 530
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """Transport that stops sending requests after repeated failures.
+
+    After ``failure_threshold`` consecutive transport errors or outage
+    responses the circuit opens and requests raise CircuitOpenError. Once
+    ``reset_timeout`` seconds have passed, one request is let through: if
+    it succeeds the circuit closes, otherwise it stays open for another
+    ``reset_timeout``.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        failure_threshold: int,
+        reset_timeout: float,
+    ) -> None:
+        self._transport = transport
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests are currently being refused."""
+        return (
+            self._opened_at is not None
+            and time.monotonic() - self._opened_at < self.reset_timeout
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._opened_at is not None:
+            if self.is_open:
+                raise CircuitOpenError(
+                    f"Circuit open for {request.url.host}", request=request
+                )
+            # Let this request probe the upstream; others keep failing fast
+            self._opened_at = time.monotonic()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError:
+            self._record_failure(request)
+            raise
+
+        if _is_outage(response):
+            self._record_failure(request)
+        else:
+            self._failures = 0
+            if self._opened_at is not None:
+                logger.info(f"Circuit closed for {request.url.host}")
+                self._opened_at = None
+        return response
+
+    def _record_failure(self, request: httpx.Request) -> None:
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(
+                    f"Circuit opened for {request.url.host} after "
+                    f"{self._failures} consecutive failures"
+                )
+            self._opened_at = time.monotonic()
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -1,17 +1,29 @@
 """Application configuration."""
 
-from functools import lru_cache
+from functools import cache
 from typing import Literal
 
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic_settings import (
+    BaseSettings,
+    DotEnvSettingsSource,
+    PydanticBaseSettingsSource,
+    SettingsConfigDict,
+)
+
+
+@cache
+def _dotenv_source(settings_cls: type[BaseSettings]) -> DotEnvSettingsSource:
+    """Read the .env file once per process instead of on every Settings()."""
+    return DotEnvSettingsSource(
+        settings_cls, env_file=".env", env_file_encoding="utf-8"
+    )
 
 
 class Settings(BaseSettings):
     """Application settings."""
 
-    model_config = SettingsConfigDict(
-        env_file=".env", env_file_encoding="utf-8", extra="ignore"
-    )
+    # .env is loaded through _dotenv_source, so env_file is left unset here
+    model_config = SettingsConfigDict(extra="ignore")
 
     SECRET_KEY: str = "lksdj;as987q3908475ukjhfgklauy983475iuhdfkjghairutyh"
     USERS_DIR: str = "users"
@@ -29,13 +41,36 @@ class Settings(BaseSettings):
     SUPABASE_URL: str = ""
     SUPABASE_ANON_KEY: str = ""
     SUPABASE_SERVICE_ROLE_KEY: str = ""
+    # Legacy HS256 JWT secret; lets access tokens be verified in-process
+    SUPABASE_JWT_SECRET: str = ""
 
     # Rate limiting settings
     RATE_LIMIT_REQUESTS: int = 60
     RATE_LIMIT_BURST: int = 10
+    # Only honour X-Forwarded-For / X-Real-IP when running behind a trusted proxy
+    TRUST_PROXY_HEADERS: bool = False
+    # Shared Redis for rate-limit counters; in-memory (per worker) when unset
+    REDIS_URL: str = ""
+
+    @classmethod
+    def settings_customise_sources(
+        cls,
+        settings_cls: type[BaseSettings],
+        init_settings: PydanticBaseSettingsSource,
+        env_settings: PydanticBaseSettingsSource,
+        dotenv_settings: PydanticBaseSettingsSource,
+        file_secret_settings: PydanticBaseSettingsSource,
+    ) -> tuple[PydanticBaseSettingsSource, ...]:
+        """Keep the default precedence but reuse the parsed .env file."""
+        return (
+            init_settings,
+            env_settings,
+            _dotenv_source(settings_cls),
+            file_secret_settings,
+        )
 
 
-@lru_cache
+@cache
 def get_settings() -> Settings:
     """Return the settings object."""
     return Settings()
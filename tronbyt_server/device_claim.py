@@ -9,28 +9,54 @@ Usage:
     from tronbyt_server.device_claim import claim_device, generate_pairing_token
 
     # Firmware calls this to generate a token
-    token = generate_pairing_token(device_id)
+    token = await generate_pairing_token(device_id)
 
     # User claims the device
-    result = claim_device(user_id, pairing_token)
+    result = await claim_device(user_id, pairing_token)
+
+Tokens are written with an upsert on ``device_id``, so the
+``device_pairing_tokens`` table must keep its UNIQUE constraint on that
+column. Claims go through the ``claim_device`` Postgres function. Both are
+defined in docs/SUPABASE_MULTI_TENANT.md.
 """
 
 import logging
-import secrets
+import os
+import re
+import time
+from base64 import urlsafe_b64encode
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from secrets import token_urlsafe
+from typing import Any
 
 from fastapi import HTTPException, status
-from pydantic import BaseModel
-
-from tronbyt_server.supabase_client import get_supabase_admin_client
 
 logger = logging.getLogger(__name__)
 
 # Pairing token validity period (minutes)
 PAIRING_TOKEN_VALIDITY_MINUTES = 30
 
+# Maximum rows returned by one get_pending_devices call
+PENDING_DEVICES_LIMIT = 100
+
+# Random bytes per pairing token (encodes to 43 URL-safe characters)
+PAIRING_TOKEN_BYTES = 32
+
+# Most devices generate_pairing_tokens_bulk accepts in one call
+PAIRING_TOKENS_BULK_LIMIT = 500
+
+# Device IDs are exactly 8 hex characters
+_DEVICE_ID_MATCH = re.compile(r"[0-9a-fA-F]{8}").fullmatch
+
+# (epoch second, ISO timestamp) reused by get_pending_devices within a second
+_pending_now: tuple[int, str] = (0, "")
+
 
-class PairingToken(BaseModel):
+# Internal result containers. They are never parsed from untrusted input, so
+# slotted dataclasses are used to skip Pydantic validation on construction.
+@dataclass(slots=True, kw_only=True)
+class PairingToken:
     """Represents a device pairing token."""
 
     device_id: str
@@ -38,7 +64,8 @@ class PairingToken(BaseModel):
     expires_at: datetime
 
 
-class ClaimResult(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class ClaimResult:
     """Result of a device claim operation."""
 
     success: bool
@@ -46,7 +73,7 @@ class ClaimResult(BaseModel):
     message: str
 
 
-def generate_pairing_token(device_id: str) -> PairingToken:
+async def generate_pairing_token(device_id: str) -> PairingToken:
     """Generate a time-limited, single-use pairing token for a device.
 
     This is called by the firmware during initial setup.
@@ -61,6 +88,9 @@ def generate_pairing_token(device_id: str) -> PairingToken:
     Raises:
         HTTPException: If token generation fails.
     """
+    # Imported lazily so validate_device_id doesn't depend on Supabase setup
+    from tronbyt_server.supabase_client import get_supabase_admin_client
+
     if not validate_device_id(device_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -70,26 +100,17 @@ def generate_pairing_token(device_id: str) -> PairingToken:
     supabase = get_supabase_admin_client()
 
     # Generate a secure random token
-    token = secrets.token_urlsafe(32)
-    expires_at = datetime.now(timezone.utc) + timedelta(
-        minutes=PAIRING_TOKEN_VALIDITY_MINUTES
-    )
+    token = token_urlsafe(PAIRING_TOKEN_BYTES)
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=PAIRING_TOKEN_VALIDITY_MINUTES)
 
     try:
-        # Delete any existing token for this device
-        supabase.table("device_pairing_tokens").delete().eq(
-            "device_id", device_id
-        ).execute()
-
-        # Create new pairing token
-        response = (
+        # Replace any existing token for this device in a single round-trip.
+        response = await (
             supabase.table("device_pairing_tokens")
-            .insert(
-                {
-                    "device_id": device_id,
-                    "token": token,
-                    "expires_at": expires_at.isoformat(),
-                }
+            .upsert(
+                _pairing_token_row(device_id, token, now, expires_at),
+                on_conflict="device_id",
             )
             .execute()
         )
@@ -117,89 +138,154 @@ def generate_pairing_token(device_id: str) -> PairingToken:
         )
 
 
-def claim_device(user_id: str, pairing_token: str) -> ClaimResult:
-    """Claim a device using a pairing token.
+async def generate_pairing_tokens_bulk(device_ids: list[str]) -> list[PairingToken]:
+    """Generate pairing tokens for many devices at once.
 
-    This binds the device to the user permanently.
-    The pairing token is single-use and time-limited.
+    Intended for bulk-provisioning tooling. Entropy for all tokens is read
+    in a single ``os.urandom`` call and every token is written with one
+    multi-row upsert. Repeated device IDs are collapsed, since Postgres
+    rejects an upsert that touches the same row twice.
 
     Args:
-        user_id: The user's UUID.
-        pairing_token: The pairing token from the device.
+        device_ids: The device IDs (8 hex characters each), at most
+            PAIRING_TOKENS_BULK_LIMIT distinct ones.
 
     Returns:
-        ClaimResult indicating success or failure.
+        A PairingToken per distinct device, in first-seen order.
+
+    Raises:
+        HTTPException: If any device ID is invalid, there are too many
+            devices, or token generation fails.
     """
+    from tronbyt_server.supabase_client import get_supabase_admin_client
+
+    device_ids = list(dict.fromkeys(device_ids))
+    if len(device_ids) > PAIRING_TOKENS_BULK_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {PAIRING_TOKENS_BULK_LIMIT} devices per request.",
+        )
+
+    invalid = [
+        device_id for device_id in device_ids if not validate_device_id(device_id)
+    ]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid device ID format: {', '.join(invalid)}. "
+            "Must be 8 hex characters.",
+        )
+    if not device_ids:
+        return []
+
     supabase = get_supabase_admin_client()
 
+    entropy = os.urandom(PAIRING_TOKEN_BYTES * len(device_ids))
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=PAIRING_TOKEN_VALIDITY_MINUTES)
+    tokens = [
+        PairingToken(
+            device_id=device_id,
+            # Same encoding as secrets.token_urlsafe
+            token=urlsafe_b64encode(
+                entropy[i * PAIRING_TOKEN_BYTES : (i + 1) * PAIRING_TOKEN_BYTES]
+            )
+            .rstrip(b"=")
+            .decode("ascii"),
+            expires_at=expires_at,
+        )
+        for i, device_id in enumerate(device_ids)
+    ]
+
     try:
-        # Find the pairing token
-        token_response = (
+        response = await (
             supabase.table("device_pairing_tokens")
-            .select("*")
-            .eq("token", pairing_token)
-            .is_("claimed_by", "null")
+            .upsert(
+                [
+                    _pairing_token_row(t.device_id, t.token, now, expires_at)
+                    for t in tokens
+                ],
+                on_conflict="device_id",
+            )
             .execute()
         )
 
-        if not token_response.data:
-            return ClaimResult(
-                success=False,
-                message="Invalid or expired pairing token",
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create pairing tokens",
             )
 
-        token_data = token_response.data[0]
-        device_id = token_data["device_id"]
-        expires_at_str = token_data["expires_at"]
+        logger.info(f"Generated pairing tokens for {len(tokens)} devices")
+
+        return tokens
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to generate pairing tokens: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate pairing tokens",
+        )
+
 
-        # Parse expiration time
-        if expires_at_str.endswith("Z"):
-            expires_at_str = expires_at_str[:-1] + "+00:00"
-        expires_at = datetime.fromisoformat(expires_at_str)
+def _pairing_token_row(
+    device_id: str, token: str, created_at: datetime, expires_at: datetime
+) -> dict[str, str | None]:
+    """Build a device_pairing_tokens row.
 
-        # Check if token has expired
-        if datetime.now(timezone.utc) > expires_at:
+    Claim fields are reset so a re-paired device starts unclaimed.
+    """
+    return {
+        "device_id": device_id,
+        "token": token,
+        "created_at": created_at.isoformat(),
+        "expires_at": expires_at.isoformat(),
+        "claimed_by": None,
+        "claimed_at": None,
+    }
+
+
+async def claim_device(user_id: str, pairing_token: str) -> ClaimResult:
+    """Claim a device using a pairing token.
+
+    This binds the device to the user permanently.
+    The pairing token is single-use and time-limited.
+
+    The token lookup, expiry and ownership checks, device upsert and token
+    update all run inside the ``claim_device`` Postgres function, so a claim
+    is one round-trip and cannot race with a concurrent claim.
+
+    Args:
+        user_id: The user's UUID.
+        pairing_token: The pairing token from the device.
+
+    Returns:
+        ClaimResult indicating success or failure.
+    """
+    from tronbyt_server.supabase_client import get_supabase_admin_client
+
+    supabase = get_supabase_admin_client()
+
+    try:
+        response = await supabase.rpc(
+            "claim_device", {"p_user_id": user_id, "p_token": pairing_token}
+        ).execute()
+
+        if not response.data:
             return ClaimResult(
                 success=False,
-                message="Pairing token has expired",
+                message="Invalid or expired pairing token",
             )
 
-        # Check if device already exists and is owned by someone else
-        existing_device = (
-            supabase.table("devices").select("user_id").eq("id", device_id).execute()
-        )
-
-        if existing_device.data:
-            existing_user_id = existing_device.data[0]["user_id"]
-            if existing_user_id != user_id:
-                return ClaimResult(
-                    success=False,
-                    message="Device is already claimed by another user",
-                )
-
-        # Create or update the device record
-        device_data = {
-            "id": device_id,
-            "user_id": user_id,
-            "name": f"Tronbyt-{device_id[:4]}",
-        }
-
-        supabase.table("devices").upsert(device_data).execute()
-
-        # Mark the token as claimed
-        supabase.table("device_pairing_tokens").update(
-            {
-                "claimed_by": user_id,
-                "claimed_at": datetime.now(timezone.utc).isoformat(),
-            }
-        ).eq("token", pairing_token).execute()
-
-        logger.info(f"Device {device_id} claimed by user {user_id}")
+        result = response.data[0]
+        if result["success"]:
+            logger.info(f"Device {result['device_id']} claimed by user {user_id}")
 
         return ClaimResult(
-            success=True,
-            device_id=device_id,
-            message="Device claimed successfully",
+            success=result["success"],
+            device_id=result["device_id"],
+            message=result["message"],
         )
     except Exception as e:
         logger.error(f"Failed to claim device: {e}")
@@ -218,37 +304,51 @@ def validate_device_id(device_id: str) -> bool:
     Returns:
         True if valid, False otherwise.
     """
-    if not device_id or len(device_id) != 8:
-        return False
-    try:
-        int(device_id, 16)
-        return True
-    except ValueError:
-        return False
+    return bool(device_id) and _DEVICE_ID_MATCH(device_id) is not None
 
 
-def get_pending_devices(user_id: str) -> list[dict]:
+async def get_pending_devices(
+    user_id: str, since: tuple[str, str] | None = None
+) -> list[dict[str, Any]]:
     """Get devices that have unclaimed pairing tokens.
 
     This is used by the dashboard to show available devices
-    for claiming.
+    for claiming. Results are ordered by ``(expires_at, device_id)`` and
+    capped at PENDING_DEVICES_LIMIT rows; pass the last row's
+    ``(expires_at, device_id)`` as ``since`` to fetch the next page. The
+    device ID breaks ties, since bulk-generated tokens share one expiry.
 
     Args:
         user_id: The user's UUID.
+        since: Optional ``(expires_at, device_id)`` keyset cursor; only
+            tokens sorting after it are returned.
 
     Returns:
         List of pending device information.
+
+    Raises:
+        HTTPException: If ``since`` is malformed.
     """
+    from tronbyt_server.supabase_client import get_supabase_admin_client
+
+    cursor_filter = _pending_cursor_filter(*since) if since else None
+
     supabase = get_supabase_admin_client()
 
     try:
-        # Get all unclaimed, non-expired tokens
-        now = datetime.now(timezone.utc).isoformat()
-        response = (
+        # Get unclaimed, non-expired tokens (served by idx_pairing_tokens_unclaimed)
+        query = (
             supabase.table("device_pairing_tokens")
             .select("device_id, created_at, expires_at")
             .is_("claimed_by", "null")
-            .gt("expires_at", now)
+            .gt("expires_at", _now_iso_to_second())
+        )
+        if cursor_filter:
+            query = query.or_(cursor_filter)
+        response = await (
+            query.order("expires_at")
+            .order("device_id")
+            .limit(PENDING_DEVICES_LIMIT)
             .execute()
         )
 
@@ -256,3 +356,41 @@ def get_pending_devices(user_id: str) -> list[dict]:
     except Exception as e:
         logger.error(f"Failed to get pending devices: {e}")
         return []
+
+
+def _pending_cursor_filter(expires_at: str, device_id: str) -> str:
+    """Build the PostgREST filter for rows after an (expires_at, device_id) cursor.
+
+    Both values are interpolated into the filter, so they are validated and
+    the timestamp is re-serialized first.
+
+    Raises:
+        HTTPException: If either value is malformed.
+    """
+    try:
+        expires_at = datetime.fromisoformat(expires_at).isoformat()
+        valid = validate_device_id(device_id)
+    except ValueError:
+        valid = False
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor.",
+        )
+    return (
+        f'expires_at.gt."{expires_at}",'
+        f'and(expires_at.eq."{expires_at}",device_id.gt.{device_id})'
+    )
+
+
+def _now_iso_to_second() -> str:
+    """Return the current UTC time in ISO format, truncated to the second.
+
+    The dashboard polls get_pending_devices frequently, so the formatted
+    timestamp is computed at most once per second.
+    """
+    global _pending_now
+    now_s = int(time.time())
+    if _pending_now[0] != now_s:
+        _pending_now = (now_s, datetime.fromtimestamp(now_s, timezone.utc).isoformat())
+    return _pending_now[1]
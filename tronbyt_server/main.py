@@ -1,5 +1,6 @@
 """Main application file."""
 
+import asyncio
 import logging
 import shutil
 import sqlite3
@@ -21,8 +22,22 @@ from tronbyt_server.dependencies import (
     auth_exception_handler,
     get_db,
 )
+from tronbyt_server.rate_limit import limiter, rate_limit_exceeded_handler
 from tronbyt_server.routers import api, auth, manager, websockets
 from tronbyt_server.routers import supabase_auth as supabase_auth_router
+from tronbyt_server.supabase_auth import (
+    flush_token_last_used,
+    flush_token_last_used_periodically,
+)
+from tronbyt_server.supabase_client import (
+    close_http_client,
+    is_supabase_enabled,
+    keep_http_pool_warm,
+)
+from tronbyt_server.supabase_db import (
+    flush_app_installations,
+    flush_app_installations_periodically,
+)
 from tronbyt_server.templates import templates
 
 MODULE_ROOT = Path(__file__).parent.resolve()
@@ -87,8 +102,27 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         with db_connection:
             db.init_db(db_connection)
 
+    # Supabase mode: periodically write out buffered API token usage and
+    # queued app installation writes, and keep the HTTP pool warm
+    background_tasks: list[asyncio.Task[None]] = []
+    if settings.AUTH_MODE == "supabase":
+        background_tasks = [
+            asyncio.create_task(flush_token_last_used_periodically()),
+            asyncio.create_task(flush_app_installations_periodically()),
+            asyncio.create_task(keep_http_pool_warm()),
+        ]
+
     yield
     # Shutdown
+    if background_tasks:
+        for task in background_tasks:
+            task.cancel()
+        # Let cancelled flushes put their batches back before the final flush
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await flush_token_last_used()
+        await flush_app_installations()
+        await close_http_client()
+
     from tronbyt_server.sync import get_sync_manager
 
     get_sync_manager(logger).shutdown()
@@ -110,17 +144,12 @@ app.add_middleware(
 )
 Babel(configs=babel_configs)
 
-# Add rate limiting middleware (optional, requires slowapi)
-try:
+# Add rate limiting middleware (supabase mode only, requires slowapi)
+if limiter is not None:
     from slowapi.errors import RateLimitExceeded
 
-    from tronbyt_server.rate_limit import limiter, rate_limit_exceeded_handler
-
-    if limiter is not None:
-        app.state.limiter = limiter
-        app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
-except ImportError:
-    pass  # slowapi not installed, rate limiting disabled
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
 
 @app.exception_handler(NotAuthenticatedException)
@@ -153,6 +182,6 @@ app.include_router(auth.router)
 app.include_router(manager.router)
 app.include_router(websockets.router)
 
-# Include Supabase auth router (endpoints work regardless of auth mode,
-# but will return appropriate errors when not in supabase mode)
-app.include_router(supabase_auth_router.router)
+# Supabase auth endpoints only exist in supabase mode
+if is_supabase_enabled():
+    app.include_router(supabase_auth_router.router)
@@ -17,11 +17,15 @@ Usage:
         ...
 """
 
+import json
 import logging
+from functools import lru_cache
 from typing import TYPE_CHECKING, Any, Callable
 
 from fastapi import Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+
+from tronbyt_server.config import get_settings
 
 if TYPE_CHECKING:
     from slowapi import Limiter
@@ -29,11 +33,18 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Read once at import so the key function does no settings lookup per request
+_TRUST_PROXY_HEADERS = get_settings().TRUST_PROXY_HEADERS
+
 
 def get_rate_limit_key(request: Request) -> str:
     """Get the rate limit key for a request.
 
-    Uses the client's IP address as the rate limit key.
+    Uses the client's IP address as the rate limit key. Proxy headers
+    (X-Forwarded-For, X-Real-IP) are only consulted when
+    TRUST_PROXY_HEADERS is enabled, since clients can spoof them. Even
+    then only the last X-Forwarded-For entry is used: the trusted proxy
+    appends it, while everything before it comes from the client.
     Falls back to a default key if IP cannot be determined.
 
     Args:
@@ -42,16 +53,16 @@ def get_rate_limit_key(request: Request) -> str:
     Returns:
         A string key for rate limiting.
     """
-    # Try X-Forwarded-For header first (for requests behind proxy)
-    forwarded_for = request.headers.get("X-Forwarded-For")
-    if forwarded_for:
-        # Get the first IP in the chain (original client)
-        return forwarded_for.split(",")[0].strip()
+    if _TRUST_PROXY_HEADERS:
+        headers = request.headers
+        # Try X-Forwarded-For header first (for requests behind proxy)
+        if forwarded_for := headers.get("X-Forwarded-For"):
+            # The address our proxy saw; earlier hops are client-supplied
+            return forwarded_for.rpartition(",")[2].strip()
 
-    # Try X-Real-IP header
-    real_ip = request.headers.get("X-Real-IP")
-    if real_ip:
-        return real_ip
+        # Try X-Real-IP header
+        if real_ip := headers.get("X-Real-IP"):
+            return real_ip
 
     # Fall back to direct client IP
     if request.client:
@@ -63,28 +74,53 @@ def get_rate_limit_key(request: Request) -> str:
 def create_limiter() -> "Limiter | None":
     """Create a SlowAPI limiter instance.
 
+    Counters are stored in Redis when REDIS_URL is set, so the limit holds
+    across all workers; otherwise each worker keeps its own in-memory counts.
+
     Returns:
         A configured Limiter instance, or None if slowapi is not available.
     """
     try:
         from slowapi import Limiter
 
-        from tronbyt_server.config import get_settings
-
         settings = get_settings()
 
+        if not settings.REDIS_URL:
+            logger.warning(
+                "REDIS_URL not set, rate limits are tracked per worker process"
+            )
+
         return Limiter(
             key_func=get_rate_limit_key,
             default_limits=[f"{settings.RATE_LIMIT_REQUESTS}/minute"],
+            # In-memory storage is only suitable for development or a single
+            # worker; with Redis all workers share one set of counters.
+            storage_uri=settings.REDIS_URL or "memory://",
         )
     except ImportError:
         logger.warning("slowapi not installed, rate limiting disabled")
         return None
 
 
-def rate_limit_exceeded_handler(
-    request: Request, exc: "RateLimitExceeded"
-) -> JSONResponse:
+@lru_cache(maxsize=64)
+def _rate_limit_body(detail: str, retry_after: int) -> bytes:
+    """Encode a 429 response body.
+
+    Details come from the configured limit strings, so only a handful of
+    distinct bodies exist and each is encoded once.
+    """
+    return json.dumps(
+        {
+            "error": "Rate limit exceeded",
+            "detail": detail,
+            "retry_after": retry_after,
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def rate_limit_exceeded_handler(request: Request, exc: "RateLimitExceeded") -> Response:
     """Handle rate limit exceeded errors.
 
     Args:
@@ -92,33 +128,35 @@ def rate_limit_exceeded_handler(
         exc: The RateLimitExceeded exception.
 
     Returns:
-        JSONResponse with 429 status code.
+        JSON Response with 429 status code.
     """
-    logger.warning(f"Rate limit exceeded for {get_rate_limit_key(request)}")
+    # slowapi records [*prefix, key, scope] for the limit that was hit
+    view_rate_limit = getattr(request.state, "view_rate_limit", None)
+    key = view_rate_limit[1][-2] if view_rate_limit else get_rate_limit_key(request)
+    logger.warning(f"Rate limit exceeded for {key}")
 
     # Cast exc to Any to access attributes that may not be statically typed
     exc_any: Any = exc
-    return JSONResponse(
+    detail = str(exc_any.detail) if hasattr(exc_any, "detail") else "Too many requests"
+    return Response(
+        content=_rate_limit_body(detail, getattr(exc_any, "retry_after", 60)),
         status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-        content={
-            "error": "Rate limit exceeded",
-            "detail": str(exc_any.detail)
-            if hasattr(exc_any, "detail")
-            else "Too many requests",
-            "retry_after": getattr(exc_any, "retry_after", 60),
-        },
+        media_type="application/json",
     )
 
 
-# Create the limiter instance (may be None if slowapi not installed)
-limiter = create_limiter()
+# Create the limiter instance. Rate limiting only applies to the public
+# multi-tenant deployment, so local mode never imports slowapi. May also be
+# None if slowapi is not installed.
+limiter = create_limiter() if get_settings().AUTH_MODE == "supabase" else None
 
 
 def rate_limit(limit: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     """Decorator to apply rate limiting to a route.
 
     This is a wrapper around the slowapi limiter.limit() decorator.
-    If slowapi is not installed, it returns a no-op decorator.
+    If rate limiting is disabled (local auth mode or slowapi not
+    installed), it returns a no-op decorator.
 
     Args:
         limit: Rate limit string (e.g., "10/minute", "100/hour").
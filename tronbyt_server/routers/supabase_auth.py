@@ -3,24 +3,29 @@
 This router provides authentication endpoints for Supabase multi-tenant mode.
 It handles login, signup, logout, and device claiming.
 
-These routes are only active when AUTH_MODE=supabase.
+main.py only includes this router when AUTH_MODE=supabase, so the
+endpoints don't check the auth mode themselves.
 """
 
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Form, HTTPException, status
+from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
 from fastapi.responses import JSONResponse, RedirectResponse, Response
+from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
-from tronbyt_server.config import Settings, get_settings
+from tronbyt_server.config import get_settings
 from tronbyt_server.device_claim import claim_device, generate_pairing_token
 from tronbyt_server.supabase_auth import (
     SupabaseUser,
+    forget_token,
     get_current_user,
+    get_request_token,
     require_user,
+    security,
 )
-from tronbyt_server.supabase_client import get_supabase_client, is_supabase_enabled
+from tronbyt_server.supabase_client import get_supabase_client
 from tronbyt_server.supabase_db import create_api_token, get_user_api_tokens
 
 router = APIRouter(prefix="/auth/supabase", tags=["supabase-auth"])
@@ -55,26 +60,18 @@ class GeneratePairingTokenRequest(BaseModel):
 
 
 @router.post("/signup")
-async def signup(
-    request: SignupRequest,
-    settings: Settings = Depends(get_settings),
-) -> JSONResponse:
+async def signup(request: SignupRequest) -> JSONResponse:
     """Sign up a new user with Supabase Auth.
 
     Args:
         request: The signup request with email, password, and username.
-        settings: Application settings.
 
     Returns:
         JSONResponse with success status or error message.
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
-
-    if settings.ENABLE_USER_REGISTRATION != "1":
+    # get_settings() is cached; resolving it through Depends() would run
+    # this sync function in the threadpool on every request.
+    if get_settings().ENABLE_USER_REGISTRATION != "1":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User registration is disabled",
@@ -82,9 +79,10 @@ async def signup(
 
     supabase = get_supabase_client()
 
+    # Only the Supabase call sits in the try block; the response is built
+    # after the connection has gone back to the pool
     try:
-        # Sign up with Supabase Auth
-        response = supabase.auth.sign_up(
+        response = await supabase.auth.sign_up(
             {
                 "email": request.email,
                 "password": request.password,
@@ -95,25 +93,6 @@ async def signup(
                 },
             }
         )
-
-        if response.user:
-            logger.info(f"User signed up: {request.email}")
-            return JSONResponse(
-                status_code=status.HTTP_201_CREATED,
-                content={
-                    "success": True,
-                    "message": "User created successfully. Please check your email for verification.",
-                    "user_id": response.user.id,
-                },
-            )
-        else:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "message": "Failed to create user",
-                },
-            )
     except Exception as e:
         logger.error(f"Signup error: {e}")
         raise HTTPException(
@@ -121,6 +100,25 @@ async def signup(
             detail=str(e),
         )
 
+    if not response.user:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "success": False,
+                "message": "Failed to create user",
+            },
+        )
+
+    logger.info(f"User signed up: {request.email}")
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content={
+            "success": True,
+            "message": "User created successfully. Please check your email for verification.",
+            "user_id": response.user.id,
+        },
+    )
+
 
 @router.post("/login")
 async def login(request: LoginRequest) -> JSONResponse:
@@ -132,54 +130,15 @@ async def login(request: LoginRequest) -> JSONResponse:
     Returns:
         JSONResponse with session tokens or error message.
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
-
     supabase = get_supabase_client()
 
     try:
-        response = supabase.auth.sign_in_with_password(
+        response = await supabase.auth.sign_in_with_password(
             {
                 "email": request.email,
                 "password": request.password,
             }
         )
-
-        if response.session:
-            logger.info(f"User logged in: {request.email}")
-
-            # Create response with session cookie
-            json_response = JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content={
-                    "success": True,
-                    "access_token": response.session.access_token,
-                    "refresh_token": response.session.refresh_token,
-                    "expires_in": response.session.expires_in,
-                },
-            )
-
-            # Set the access token as a cookie for web clients
-            json_response.set_cookie(
-                key="sb-access-token",
-                value=response.session.access_token,
-                max_age=response.session.expires_in,
-                httponly=True,
-                samesite="lax",
-            )
-
-            return json_response
-        else:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={
-                    "success": False,
-                    "message": "Invalid credentials",
-                },
-            )
     except Exception as e:
         logger.error(f"Login error: {e}")
         raise HTTPException(
@@ -187,29 +146,62 @@ async def login(request: LoginRequest) -> JSONResponse:
             detail="Invalid credentials",
         )
 
+    session = response.session
+    if not session:
+        return JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            content={
+                "success": False,
+                "message": "Invalid credentials",
+            },
+        )
+
+    logger.info(f"User logged in: {request.email}")
+
+    # Create response with session cookie
+    json_response = JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "success": True,
+            "access_token": session.access_token,
+            "refresh_token": session.refresh_token,
+            "expires_in": session.expires_in,
+        },
+    )
+
+    # Set the access token as a cookie for web clients
+    json_response.set_cookie(
+        key="sb-access-token",
+        value=session.access_token,
+        max_age=session.expires_in,
+        httponly=True,
+        samesite="lax",
+    )
+
+    return json_response
+
 
 @router.post("/logout")
 async def logout(
+    request: Request,
     user: SupabaseUser | None = Depends(get_current_user),
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
 ) -> Response:
     """Log out the current user.
 
     Args:
+        request: The FastAPI request object.
         user: The current authenticated user.
+        credentials: Optional HTTP authorization credentials.
 
     Returns:
         Response with cleared session cookie.
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
-
     if user:
+        forget_token(get_request_token(request, credentials))
         supabase = get_supabase_client()
         try:
-            supabase.auth.sign_out()
+            await supabase.auth.sign_out()
             logger.info(f"User logged out: {user.email}")
         except Exception as e:
             logger.warning(f"Logout error: {e}")
@@ -257,13 +249,7 @@ async def claim_device_endpoint(
     Returns:
         JSONResponse with claim result.
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
-
-    result = claim_device(user.id, request.pairing_token)
+    result = await claim_device(user.id, request.pairing_token)
 
     if result.success:
         return JSONResponse(
@@ -299,13 +285,7 @@ async def generate_pairing_token_endpoint(
     Returns:
         JSONResponse with pairing token and expiration.
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
-
-    token = generate_pairing_token(request.device_id)
+    token = await generate_pairing_token(request.device_id)
 
     return JSONResponse(
         status_code=status.HTTP_201_CREATED,
@@ -331,13 +311,7 @@ async def generate_api_key_endpoint(
     Returns:
         JSONResponse with the new API key.
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
-
-    token = create_api_token(user.id, name)
+    token = await create_api_token(user.id, name)
 
     if token:
         return JSONResponse(
@@ -368,28 +342,15 @@ async def list_api_keys(
     Returns:
         JSONResponse with list of API keys (tokens are masked).
     """
-    if not is_supabase_enabled():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Supabase authentication is not enabled",
-        )
+    tokens = await get_user_api_tokens(user.id)
 
-    tokens = get_user_api_tokens(user.id)
-
-    # Mask the token values for security
-    masked_tokens = []
-    for t in tokens:
-        masked_tokens.append(
-            {
-                "id": t["id"],
-                "name": t["name"],
-                "token_preview": t["token"][:8] + "..." if t["token"] else "",
-                "created_at": t["created_at"],
-                "last_used_at": t["last_used_at"],
-            }
-        )
+    # Rows already have the response shape; only the ellipsis is added here
+    api_keys = [
+        {**t, "token_preview": f"{t['token_preview']}..." if t["token_preview"] else ""}
+        for t in tokens
+    ]
 
     return JSONResponse(
         status_code=status.HTTP_200_OK,
-        content={"api_keys": masked_tokens},
+        content={"api_keys": api_keys},
     )
@@ -11,17 +11,29 @@ Usage:
         return {"user": user.username}
 """
 
+import asyncio
+import base64
+import copy
+import hashlib
+import json
 import logging
-from typing import TYPE_CHECKING
+import time
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any, cast
 
+import jwt
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 
+from tronbyt_server.config import get_settings
 from tronbyt_server.supabase_client import (
+    get_http_client,
     get_supabase_admin_client,
     get_supabase_client,
 )
+from tronbyt_server.supabase_db import get_user_profile, hash_api_key
+from tronbyt_server.ttl_cache import TTLCache
 
 if TYPE_CHECKING:
     pass
@@ -40,6 +52,150 @@ class SupabaseUser(BaseModel):
     theme_preference: str = "system"
 
 
+# Verified users keyed by token hash, so repeat requests with the same bearer
+# skip the Supabase round-trip. The short TTL bounds how long a revoked
+# token keeps working.
+_user_cache: TTLCache[str, SupabaseUser] = TTLCache(maxsize=10_000, ttl=30)
+
+# Successful API key lookups, keyed "<key hash>:<device id>", as (user, device,
+# whether the key is an api_tokens token). Devices poll with the same key
+# constantly; delete_api_token and forget_token evict a key, and the short TTL
+# bounds how long a key revoked elsewhere keeps working.
+_api_key_cache: TTLCache[str, tuple[SupabaseUser, dict[str, Any] | None, bool]] = (
+    TTLCache(maxsize=10_000, ttl=30)
+)
+
+# Tokens and API keys that were definitively rejected (bad signature, expired,
+# unknown key), so repeats are refused without verifying them again
+_rejected_tokens: TTLCache[str, bool] = TTLCache(maxsize=50_000, ttl=10)
+
+
+# How often buffered api_tokens.last_used_at values are written out
+LAST_USED_FLUSH_INTERVAL_SECONDS = 30
+
+# API token hash -> when it last authenticated a request, flushed in batches
+# so the request path does no writes. Only touched from the event loop.
+_pending_last_used: dict[str, datetime] = {}
+
+
+def _token_cache_key(token: str) -> str:
+    """Return the cache key for a token (never store raw tokens)."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _token_seconds_left(token: str) -> float:
+    """Return seconds until the JWT ``exp`` claim, or 0 if it can't be read.
+
+    The signature is not checked here; this is only used to cap the cache TTL
+    of a token Supabase has already verified.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return float(claims["exp"]) - time.time()
+    except Exception:
+        return 0.0
+
+
+# Minimum time between JWKS fetches, so tokens with made-up key IDs can't
+# trigger a fetch per request
+JWKS_REFRESH_INTERVAL_SECONDS = 300
+
+# The project's asymmetric signing keys by key ID, loaded from its JWKS
+_signing_keys: dict[str, jwt.PyJWK] = {}
+_signing_keys_fetched_at: float | None = None
+
+
+async def _get_signing_key(kid: str | None) -> jwt.PyJWK | None:
+    """Return the project's public key for ``kid``, refreshing JWKS if unknown."""
+    global _signing_keys_fetched_at
+
+    if not kid:
+        return None
+    if kid not in _signing_keys and (
+        _signing_keys_fetched_at is None
+        or time.monotonic() - _signing_keys_fetched_at >= JWKS_REFRESH_INTERVAL_SECONDS
+    ):
+        _signing_keys_fetched_at = time.monotonic()
+        url = f"{get_settings().SUPABASE_URL}/auth/v1/.well-known/jwks.json"
+        try:
+            response = await get_http_client().get(url)
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+            _signing_keys.update(
+                {key.key_id: key for key in jwk_set.keys if key.key_id}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to fetch Supabase JWKS: {e}")
+    return _signing_keys.get(kid)
+
+
+async def _verify_token_locally(token: str) -> dict[str, Any] | None:
+    """Verify a Supabase access token in-process.
+
+    HS256 tokens are checked against SUPABASE_JWT_SECRET; asymmetric tokens
+    against the project's JWKS.
+
+    Args:
+        token: The access token.
+
+    Returns:
+        The verified claims, or None if the token can't be checked locally
+        (no JWT secret configured, or an unknown signing key).
+
+    Raises:
+        jwt.InvalidTokenError: If the token is malformed, expired or forged.
+    """
+    header = jwt.get_unverified_header(token)
+    if header.get("alg") == "HS256":
+        secret = get_settings().SUPABASE_JWT_SECRET
+        if not secret:
+            return None
+        return jwt.decode(token, secret, algorithms=["HS256"], audience="authenticated")
+
+    signing_key = await _get_signing_key(header.get("kid"))
+    if signing_key is None:
+        return None
+    return jwt.decode(
+        token,
+        signing_key,
+        algorithms=[signing_key.algorithm_name],
+        audience="authenticated",
+    )
+
+
+def get_request_token(
+    request: Request, credentials: HTTPAuthorizationCredentials | None
+) -> str | None:
+    """Return the bearer token from the Authorization header or session cookie."""
+    if credentials and credentials.credentials:
+        return credentials.credentials
+    return request.cookies.get("sb-access-token")
+
+
+def forget_token(token: str | None) -> None:
+    """Drop a token's cached user, e.g. on logout.
+
+    Args:
+        token: The access token to evict; None is ignored.
+    """
+    if token:
+        _user_cache.pop(_token_cache_key(token))
+        forget_api_key(hash_api_key(token))
+
+
+def forget_api_key(token_hash: str) -> None:
+    """Drop an API key's cached lookups, for every device it was used with.
+
+    Args:
+        token_hash: The key's hash, as stored in api_tokens.token_hash.
+    """
+    prefix = f"{token_hash}:"
+    _api_key_cache.pop_where(lambda key: key.startswith(prefix))
+
+
 async def get_current_user(
     request: Request,
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
@@ -57,49 +213,54 @@ async def get_current_user(
     Returns:
         SupabaseUser if authenticated, None otherwise.
     """
-    supabase = get_supabase_client()
-
-    # Try to get token from Authorization header
-    token = None
-    if credentials:
-        token = credentials.credentials
+    # CORS preflights never carry credentials
+    if request.method == "OPTIONS":
+        return None
 
-    # Fallback to cookie-based session
+    token = get_request_token(request, credentials)
     if not token:
-        token = request.cookies.get("sb-access-token")
+        return None
 
-    if not token:
+    cache_key = _token_cache_key(token)
+    cached_user = _user_cache.get(cache_key)
+    if cached_user is not None:
+        return cached_user
+    if cache_key in _rejected_tokens:
         return None
 
     try:
-        # Verify the token with Supabase
-        user_response = supabase.auth.get_user(token)
-        if not user_response or not user_response.user:
-            return None
-
-        auth_user = user_response.user
-
-        # Get user profile from database
-        profile_response = (
-            supabase.table("user_profiles")
-            .select("*")
-            .eq("id", auth_user.id)
-            .single()
-            .execute()
-        )
-
-        if not profile_response.data:
-            return None
-
-        profile = profile_response.data
+        claims = await _verify_token_locally(token)
+    except jwt.InvalidTokenError as e:
+        logger.debug(f"Rejected access token: {e}")
+        _rejected_tokens.set(cache_key, True)
+        return None
 
-        return SupabaseUser(
-            id=auth_user.id,
-            email=auth_user.email or "",
+    try:
+        if claims is not None:
+            # Verified in-process; only the (cached) profile is fetched
+            profile = await get_user_profile(claims["sub"])
+            if not profile:
+                return None
+            profile = {**profile, "email": claims.get("email") or profile.get("email")}
+        else:
+            # One round-trip: PostgREST verifies the JWT, and the function
+            # joins the profile for auth.uid(). The header is set on this
+            # request only, so the shared client's session is never touched.
+            query = get_supabase_client().rpc("get_user_with_profile", {})
+            query.request.headers["Authorization"] = f"Bearer {token}"
+            profile = cast(dict[str, Any] | None, (await query.execute()).data)
+            if not profile:
+                return None
+
+        user = SupabaseUser(
+            id=profile["id"],
+            email=profile.get("email") or "",
             username=profile.get("username", ""),
             is_admin=profile.get("is_admin", False),
             theme_preference=profile.get("theme_preference", "system"),
         )
+        _user_cache.set(cache_key, user, ttl=_token_seconds_left(token))
+        return user
     except Exception as e:
         logger.warning(f"Auth error: {e}")
         return None
@@ -150,7 +311,7 @@ async def require_admin(
     return user
 
 
-def validate_device_ownership(user_id: str, device_id: str) -> bool:
+async def validate_device_ownership(user_id: str, device_id: str) -> bool:
     """Validate that a user owns a specific device.
 
     This function checks the database to ensure the device
@@ -163,18 +324,21 @@ def validate_device_ownership(user_id: str, device_id: str) -> bool:
     Returns:
         True if the user owns the device, False otherwise.
     """
+    from postgrest.types import CountMethod
+
     supabase = get_supabase_client()
 
     try:
-        response = (
+        # HEAD request: only the count comes back, no row payload
+        response = await (
             supabase.table("devices")
-            .select("id")
+            .select("id", count=CountMethod.exact, head=True)
             .eq("id", device_id)
             .eq("user_id", user_id)
             .execute()
         )
 
-        return bool(response.data)
+        return bool(response.count)
     except Exception as e:
         logger.error(f"Device ownership check failed: {e}")
         return False
@@ -183,13 +347,15 @@ def validate_device_ownership(user_id: str, device_id: str) -> bool:
 async def get_user_and_device_from_api_key(
     device_id: str | None = None,
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
-) -> tuple[SupabaseUser | None, dict | None]:
+) -> tuple[SupabaseUser | None, dict[str, Any] | None]:
     """Get user and device from API key (for API routes).
 
     This function authenticates API requests using either:
     1. User API token (from api_tokens table)
     2. Device-specific API key (from devices table)
 
+    Successful lookups are cached for a short time per key and device.
+
     Args:
         device_id: Optional device ID from the route path.
         credentials: HTTP authorization credentials (Bearer token).
@@ -207,73 +373,58 @@ async def get_user_and_device_from_api_key(
         )
 
     api_key = credentials.credentials
+    token_hash = hash_api_key(api_key)
+    cache_key = f"{token_hash}:{device_id}"
+    if cache_key in _rejected_tokens:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+        )
+
+    cached = _api_key_cache.get(cache_key)
+    if cached is not None:
+        user, device, is_api_token = cached
+        if is_api_token:
+            _pending_last_used[token_hash] = datetime.now(UTC)
+        return user, copy.deepcopy(device)
+
     supabase = get_supabase_admin_client()  # Use admin client to bypass RLS
 
     try:
-        # First, try to find user by API token
-        token_response = (
-            supabase.table("api_tokens")
-            .select("user_id")
-            .eq("token", api_key)
-            .execute()
-        )
+        # First, try to find user by API token (profile and device in one call)
+        token_response = await supabase.rpc(
+            "get_user_by_api_token",
+            {"p_token_hash": token_hash, "p_device_id": device_id},
+        ).execute()
 
         if token_response.data:
-            user_id = token_response.data[0]["user_id"]
-
-            # Update last_used_at with current timestamp
-            from datetime import datetime, timezone
-
-            supabase.table("api_tokens").update(
-                {"last_used_at": datetime.now(timezone.utc).isoformat()}
-            ).eq("token", api_key).execute()
-
-            # Get user profile
-            profile_response = (
-                supabase.table("user_profiles")
-                .select("*")
-                .eq("id", user_id)
-                .single()
-                .execute()
+            token_data = cast(dict[str, Any], token_response.data)
+            profile = token_data["profile"]
+            user_id = profile["id"]
+
+            # Written out by flush_token_last_used
+            _pending_last_used[token_hash] = datetime.now(UTC)
+
+            user = SupabaseUser(
+                id=user_id,
+                email=profile.get("email", ""),
+                username=profile.get("username", ""),
+                is_admin=profile.get("is_admin", False),
             )
-
-            if profile_response.data:
-                user = SupabaseUser(
-                    id=user_id,
-                    email=profile_response.data.get("email", ""),
-                    username=profile_response.data.get("username", ""),
-                    is_admin=profile_response.data.get("is_admin", False),
-                )
-
-                # Get device if device_id provided
-                device = None
-                if device_id:
-                    device_response = (
-                        supabase.table("devices")
-                        .select("*")
-                        .eq("id", device_id)
-                        .eq("user_id", user_id)
-                        .execute()
-                    )
-
-                    if device_response.data:
-                        device = device_response.data[0]
-
-                return user, device
+            device = token_data["device"]
+            _api_key_cache.set(cache_key, (user, copy.deepcopy(device), True))
+            return user, device
 
         # Second, try device-specific API key
         if device_id:
-            device_response = (
-                supabase.table("devices")
-                .select("*, user_profiles!inner(*)")
-                .eq("id", device_id)
-                .eq("api_key", api_key)
-                .execute()
-            )
+            device_response = await supabase.rpc(
+                "get_device_by_api_key",
+                {"p_device_id": device_id, "p_api_key": api_key},
+            ).execute()
 
             if device_response.data:
-                device_data = device_response.data[0]
-                profile = device_data.pop("user_profiles")
+                device_data = cast(dict[str, Any], device_response.data)
+                profile = device_data["profile"]
 
                 user = SupabaseUser(
                     id=profile["id"],
@@ -282,8 +433,11 @@ async def get_user_and_device_from_api_key(
                     is_admin=profile.get("is_admin", False),
                 )
 
-                return user, device_data
+                device = device_data["device"]
+                _api_key_cache.set(cache_key, (user, copy.deepcopy(device), False))
+                return user, device
 
+        _rejected_tokens.set(cache_key, True)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
@@ -296,3 +450,44 @@ async def get_user_and_device_from_api_key(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication failed",
         )
+
+
+async def _touch_api_tokens(batch: dict[str, datetime]) -> None:
+    """Write a batch of last_used_at timestamps with one RPC call."""
+    supabase = get_supabase_admin_client()
+    await supabase.rpc(
+        "touch_api_tokens",
+        {
+            "p_token_hashes": list(batch),
+            "p_used_at": [used_at.isoformat() for used_at in batch.values()],
+        },
+    ).execute()
+
+
+async def flush_token_last_used() -> None:
+    """Write buffered API token last_used_at values to Supabase.
+
+    On failure or cancellation the batch is put back, unless a newer
+    timestamp for the same token has been recorded since.
+    """
+    global _pending_last_used
+
+    if not _pending_last_used:
+        return
+
+    batch, _pending_last_used = _pending_last_used, {}
+    try:
+        await _touch_api_tokens(batch)
+    except BaseException as e:
+        for token_hash, used_at in batch.items():
+            _pending_last_used.setdefault(token_hash, used_at)
+        if not isinstance(e, Exception):
+            raise
+        logger.error(f"Failed to flush API token usage: {e}")
+
+
+async def flush_token_last_used_periodically() -> None:
+    """Flush buffered API token usage every LAST_USED_FLUSH_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(LAST_USED_FLUSH_INTERVAL_SECONDS)
+        await flush_token_last_used()
@@ -7,10 +7,11 @@ Usage:
     from tronbyt_server.supabase_client import get_supabase_client
 
     supabase = get_supabase_client()
-    # Use supabase.auth for authentication
-    # Use supabase.table() for database operations
+    # Use await supabase.auth... for authentication
+    # Use await supabase.table(...)...execute() for database operations
 """
 
+import asyncio
 import logging
 from functools import lru_cache
 from typing import TYPE_CHECKING
@@ -18,23 +19,86 @@ from typing import TYPE_CHECKING
 from tronbyt_server.config import get_settings
 
 if TYPE_CHECKING:
-    from supabase import Client
+    import httpx
+    from supabase import AsyncClient
 
 logger = logging.getLogger(__name__)
 
+# How long an idle pooled connection is kept open
+KEEPALIVE_EXPIRY_SECONDS = 60.0
+# How often keep_http_pool_warm touches Supabase; must stay below the
+# keepalive expiry or the warm connection is dropped between pings
+POOL_WARM_INTERVAL_SECONDS = 45
+
+# Consecutive failed Supabase requests that open the circuit breaker, and
+# how long it then refuses requests before letting one through
+CIRCUIT_FAILURE_THRESHOLD = 10
+CIRCUIT_RESET_SECONDS = 30.0
+
+# AUTH_MODE and the Supabase credentials don't change after startup, so the
+# checks below are evaluated once and then served from these flags.
+_supabase_enabled: bool | None = None
+_supabase_configured: bool | None = None
+
+
+def _reset_cache() -> None:
+    """Forget the cached configuration checks (used by tests)."""
+    global _supabase_enabled, _supabase_configured
+    _supabase_enabled = None
+    _supabase_configured = None
+
 
 def _check_supabase_config() -> bool:
     """Check if Supabase is properly configured."""
-    settings = get_settings()
-    return bool(
-        settings.AUTH_MODE == "supabase"
-        and settings.SUPABASE_URL
-        and settings.SUPABASE_ANON_KEY
+    global _supabase_configured
+    if _supabase_configured is None:
+        settings = get_settings()
+        _supabase_configured = bool(
+            settings.AUTH_MODE == "supabase"
+            and settings.SUPABASE_URL
+            and settings.SUPABASE_ANON_KEY
+        )
+    return _supabase_configured
+
+
+@lru_cache
+def get_http_client() -> "httpx.AsyncClient":
+    """Get the HTTP connection pool shared by all Supabase clients.
+
+    Reusing one pool lets auth and PostgREST calls keep their TCP and TLS
+    sessions alive instead of each client opening its own connections. The
+    pool stays below the Supabase pooler's ~15 connection cap, failed
+    connection attempts are retried twice, and a circuit breaker fails
+    requests fast while Supabase is unreachable.
+
+    Returns:
+        An HTTP/2 httpx client; close it with close_http_client().
+    """
+    import httpx
+
+    from tronbyt_server.circuit_breaker import CircuitBreakerTransport
+
+    # limits/http2 belong on the transport: httpx ignores the client-level
+    # ones once a transport is passed
+    pool = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=12,
+            max_keepalive_connections=6,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        retries=2,
+    )
+    transport = CircuitBreakerTransport(
+        pool,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_SECONDS,
     )
+    return httpx.AsyncClient(transport=transport, timeout=10.0, follow_redirects=True)
 
 
 @lru_cache
-def get_supabase_client() -> "Client":
+def get_supabase_client() -> "AsyncClient":
     """Get a Supabase client instance.
 
     This client uses the anonymous key and is suitable for
@@ -55,14 +119,20 @@ def get_supabase_client() -> "Client":
         )
 
     # Import here to avoid import errors when supabase is not installed
-    from supabase import create_client
+    from supabase import AsyncClient, AsyncClientOptions
 
     logger.info(f"Initializing Supabase client for {settings.SUPABASE_URL}")
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY)
+    # The constructor already sets the key headers; acreate_client() would
+    # only add a stored-session lookup, which a server-side client never has.
+    return AsyncClient(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_ANON_KEY,
+        options=AsyncClientOptions(httpx_client=get_http_client()),
+    )
 
 
 @lru_cache
-def get_supabase_admin_client() -> "Client":
+def get_supabase_admin_client() -> "AsyncClient":
     """Get a Supabase client with service role (admin) permissions.
 
     This client uses the service role key and bypasses Row Level Security.
@@ -90,10 +160,43 @@ def get_supabase_admin_client() -> "Client":
         )
 
     # Import here to avoid import errors when supabase is not installed
-    from supabase import create_client
+    from supabase import AsyncClient, AsyncClientOptions
 
     logger.info("Initializing Supabase admin client")
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+    return AsyncClient(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SERVICE_ROLE_KEY,
+        options=AsyncClientOptions(httpx_client=get_http_client()),
+    )
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP pool if it was created (called on shutdown).
+
+    The cached Supabase clients hold the pool too, so they are dropped as
+    well; the next get_supabase_client() call builds a fresh client and pool.
+    """
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+    get_supabase_client.cache_clear()
+    get_supabase_admin_client.cache_clear()
+
+
+async def keep_http_pool_warm() -> None:
+    """Issue a cheap query every POOL_WARM_INTERVAL_SECONDS.
+
+    Keeps a pooled connection open (it would otherwise expire after the
+    keepalive window) so the next real request skips the TCP and TLS
+    handshake.
+    """
+    while True:
+        await asyncio.sleep(POOL_WARM_INTERVAL_SECONDS)
+        try:
+            supabase = get_supabase_admin_client()
+            await supabase.table("user_profiles").select("id").limit(1).execute()
+        except Exception as e:
+            logger.warning(f"Supabase keep-alive query failed: {e}")
 
 
 def is_supabase_enabled() -> bool:
@@ -102,5 +205,7 @@ def is_supabase_enabled() -> bool:
     Returns:
         True if AUTH_MODE is set to 'supabase', False otherwise.
     """
-    settings = get_settings()
-    return settings.AUTH_MODE == "supabase"
+    global _supabase_enabled
+    if _supabase_enabled is None:
+        _supabase_enabled = get_settings().AUTH_MODE == "supabase"
+    return _supabase_enabled
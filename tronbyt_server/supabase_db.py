@@ -6,32 +6,88 @@ It mirrors the functionality of db.py but uses Supabase PostgreSQL.
 Usage:
     from tronbyt_server.supabase_db import get_user_devices, save_device
 
-    devices = get_user_devices(user_id)
-    save_device(user_id, device_data)
+    devices = await get_user_devices(user_id)
+    await save_device(user_id, device_data)
 """
 
+import asyncio
+import copy
+import hashlib
 import logging
 import secrets
-import string
-from typing import Any
+from typing import Any, cast
 
 from tronbyt_server.supabase_client import (
     get_supabase_admin_client,
     get_supabase_client,
 )
+from tronbyt_server.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Leading characters of an API key kept in the clear for display
+API_KEY_PREFIX_LENGTH = 8
+
+# Profiles change rarely but are read on every authenticated request
+_profile_cache: TTLCache[str, dict[str, Any]] = TTLCache(maxsize=5000, ttl=60)
+
+# Columns read back from app_installations; user_id, device_id and
+# updated_at are left out since callers already know or never use them
+APP_INSTALLATION_COLUMNS = (
+    "id, iname, name, path, enabled, uinterval, display_time, config, "
+    "last_render, empty_last_render, pushed, notes, schedule, "
+    "recurrence_pattern, created_at"
+)
+
+# (user_id, device_id, iname) -> installation row, or {} for a known miss.
+# Lookup-before-save probes mostly miss, so misses are cached too; writes
+# evict their key and the short TTL bounds staleness otherwise.
+_app_installation_cache: TTLCache[tuple[str, str, str], dict[str, Any]] = TTLCache(
+    maxsize=50_000, ttl=5
+)
+
+# (user_id, device_id) -> that device's app list. Devices poll the same list
+# over and over; _forget_app_installations evicts it on every write.
+_device_apps_cache: TTLCache[tuple[str, str], list[dict[str, Any]]] = TTLCache(
+    maxsize=10_000, ttl=5
+)
+
+# How often queued app installation writes are sent, the most rows sent in
+# one PostgREST request, and how many failed flushes a write survives
+APP_WRITE_FLUSH_INTERVAL_SECONDS = 0.25
+APP_WRITE_BATCH_SIZE = 100
+APP_WRITE_MAX_ATTEMPTS = 3
+
+# (user_id, device_id, iname) -> app data to upsert, or None to delete.
+# Later writes to the same installation replace earlier ones. Only touched
+# from the event loop.
+_pending_app_writes: dict[tuple[str, str, str], dict[str, Any] | None] = {}
+# Failed flushes so far for each queued write that is being retried
+_app_write_failures: dict[tuple[str, str, str], int] = {}
+
 
 def generate_api_key() -> str:
     """Generate a random API key.
 
     Returns:
-        A 32-character alphanumeric API key.
+        A 32-character URL-safe API key (192 random bits).
     """
-    return "".join(
-        secrets.choice(string.ascii_letters + string.digits) for _ in range(32)
-    )
+    return secrets.token_urlsafe(24)
+
+
+def hash_api_key(api_key: str) -> str:
+    """Hash an API key for storage and lookup in api_tokens.token_hash.
+
+    Keys are long random strings, so an unsalted SHA-256 is enough; only the
+    digest is stored, never the key itself.
+
+    Args:
+        api_key: The plaintext API key.
+
+    Returns:
+        The hex-encoded SHA-256 digest.
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()
 
 
 # ============================================
@@ -39,32 +95,46 @@ def generate_api_key() -> str:
 # ============================================
 
 
-def get_user_profile(user_id: str) -> dict[str, Any] | None:
+async def get_user_profile(user_id: str) -> dict[str, Any] | None:
     """Get a user profile by ID.
 
+    Results are cached for a short time; update_user_profile invalidates
+    the entry. Each call returns its own copy, so callers may modify it.
+    Callers must already have authenticated the user, since the lookup
+    uses the admin client.
+
     Args:
         user_id: The user's UUID.
 
     Returns:
         User profile dict or None if not found.
     """
-    supabase = get_supabase_client()
+    profile = _profile_cache.get(user_id)
+    if profile is not None:
+        return copy.deepcopy(profile)
+
+    supabase = get_supabase_admin_client()
 
     try:
-        response = (
+        response = await (
             supabase.table("user_profiles")
             .select("*")
             .eq("id", user_id)
-            .single()
+            .maybe_single()
             .execute()
         )
-        return response.data
+        # maybe_single() returns no response at all when the row is missing
+        if response is None:
+            return None
+        profile = cast(dict[str, Any], response.data)
+        _profile_cache.set(user_id, copy.deepcopy(profile))
+        return profile
     except Exception as e:
         logger.error(f"Failed to get user profile: {e}")
         return None
 
 
-def update_user_profile(user_id: str, updates: dict[str, Any]) -> bool:
+async def update_user_profile(user_id: str, updates: dict[str, Any]) -> bool:
     """Update a user profile.
 
     Args:
@@ -77,7 +147,10 @@ def update_user_profile(user_id: str, updates: dict[str, Any]) -> bool:
     supabase = get_supabase_client()
 
     try:
-        supabase.table("user_profiles").update(updates).eq("id", user_id).execute()
+        await (
+            supabase.table("user_profiles").update(updates).eq("id", user_id).execute()
+        )
+        _profile_cache.pop(user_id)
         return True
     except Exception as e:
         logger.error(f"Failed to update user profile: {e}")
@@ -89,21 +162,22 @@ def update_user_profile(user_id: str, updates: dict[str, Any]) -> bool:
 # ============================================
 
 
-def get_user_api_tokens(user_id: str) -> list[dict[str, Any]]:
+async def get_user_api_tokens(user_id: str) -> list[dict[str, Any]]:
     """Get all API tokens for a user.
 
     Args:
         user_id: The user's UUID.
 
     Returns:
-        List of API token records.
+        List of API token records. Only ``token_preview`` (the stored key
+        prefix) identifies the key; the key itself is never stored.
     """
     supabase = get_supabase_client()
 
     try:
-        response = (
+        response = await (
             supabase.table("api_tokens")
-            .select("id, name, token, created_at, last_used_at, expires_at")
+            .select("id, name, token_preview:token_prefix, created_at, last_used_at")
             .eq("user_id", user_id)
             .order("created_at", desc=True)
             .execute()
@@ -114,7 +188,9 @@ def get_user_api_tokens(user_id: str) -> list[dict[str, Any]]:
         return []
 
 
-def create_api_token(user_id: str, name: str = "Default") -> dict[str, Any] | None:
+async def create_api_token(
+    user_id: str, name: str = "Default"
+) -> dict[str, Any] | None:
     """Create a new API token for a user.
 
     Args:
@@ -122,32 +198,36 @@ def create_api_token(user_id: str, name: str = "Default") -> dict[str, Any] | No
         name: A friendly name for the token.
 
     Returns:
-        The created token record or None on failure.
+        The created token record, including the plaintext ``token`` (the only
+        time it is available), or None on failure.
     """
     supabase = get_supabase_client()
     token = generate_api_key()
 
     try:
-        response = (
+        response = await (
             supabase.table("api_tokens")
             .insert(
                 {
                     "user_id": user_id,
-                    "token": token,
+                    "token_hash": hash_api_key(token),
+                    "token_prefix": token[:API_KEY_PREFIX_LENGTH],
                     "name": name,
                 }
             )
             .execute()
         )
-        return response.data[0] if response.data else None
+        return {**response.data[0], "token": token} if response.data else None
     except Exception as e:
         logger.error(f"Failed to create API token: {e}")
         return None
 
 
-def delete_api_token(user_id: str, token_id: str) -> bool:
+async def delete_api_token(user_id: str, token_id: str) -> bool:
     """Delete an API token.
 
+    The token's cached API key lookups in this process are evicted too.
+
     Args:
         user_id: The user's UUID (for ownership verification).
         token_id: The token's UUID.
@@ -155,12 +235,21 @@ def delete_api_token(user_id: str, token_id: str) -> bool:
     Returns:
         True if successful, False otherwise.
     """
+    # supabase_auth imports this module, so import it here
+    from tronbyt_server.supabase_auth import forget_api_key
+
     supabase = get_supabase_client()
 
     try:
-        supabase.table("api_tokens").delete().eq("id", token_id).eq(
-            "user_id", user_id
-        ).execute()
+        response = await (
+            supabase.table("api_tokens")
+            .delete()
+            .eq("id", token_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+        for row in cast(list[dict[str, Any]], response.data or []):
+            forget_api_key(row["token_hash"])
         return True
     except Exception as e:
         logger.error(f"Failed to delete API token: {e}")
@@ -172,7 +261,7 @@ def delete_api_token(user_id: str, token_id: str) -> bool:
 # ============================================
 
 
-def get_user_devices(user_id: str) -> list[dict[str, Any]]:
+async def get_user_devices(user_id: str) -> list[dict[str, Any]]:
     """Get all devices for a user.
 
     Args:
@@ -184,7 +273,7 @@ def get_user_devices(user_id: str) -> list[dict[str, Any]]:
     supabase = get_supabase_client()
 
     try:
-        response = (
+        response = await (
             supabase.table("devices")
             .select("*")
             .eq("user_id", user_id)
@@ -197,7 +286,7 @@ def get_user_devices(user_id: str) -> list[dict[str, Any]]:
         return []
 
 
-def get_device(user_id: str, device_id: str) -> dict[str, Any] | None:
+async def get_device(user_id: str, device_id: str) -> dict[str, Any] | None:
     """Get a specific device.
 
     Args:
@@ -210,21 +299,21 @@ def get_device(user_id: str, device_id: str) -> dict[str, Any] | None:
     supabase = get_supabase_client()
 
     try:
-        response = (
+        response = await (
             supabase.table("devices")
             .select("*")
             .eq("id", device_id)
             .eq("user_id", user_id)
-            .single()
+            .maybe_single()
             .execute()
         )
-        return response.data
+        return response.data if response else None
     except Exception as e:
         logger.error(f"Failed to get device: {e}")
         return None
 
 
-def save_device(user_id: str, device_data: dict[str, Any]) -> bool:
+async def save_device(user_id: str, device_data: dict[str, Any]) -> bool:
     """Save or update a device.
 
     Args:
@@ -240,14 +329,14 @@ def save_device(user_id: str, device_data: dict[str, Any]) -> bool:
         # Ensure user_id is set
         device_data["user_id"] = user_id
 
-        supabase.table("devices").upsert(device_data).execute()
+        await supabase.table("devices").upsert(device_data).execute()
         return True
     except Exception as e:
         logger.error(f"Failed to save device: {e}")
         return False
 
 
-def delete_device(user_id: str, device_id: str) -> bool:
+async def delete_device(user_id: str, device_id: str) -> bool:
     """Delete a device.
 
     Args:
@@ -260,9 +349,14 @@ def delete_device(user_id: str, device_id: str) -> bool:
     supabase = get_supabase_client()
 
     try:
-        supabase.table("devices").delete().eq("id", device_id).eq(
-            "user_id", user_id
-        ).execute()
+        await (
+            supabase.table("devices")
+            .delete()
+            .eq("id", device_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+        _device_apps_cache.pop((user_id, device_id))
         return True
     except Exception as e:
         logger.error(f"Failed to delete device: {e}")
@@ -274,9 +368,19 @@ def delete_device(user_id: str, device_id: str) -> bool:
 # ============================================
 
 
-def get_device_apps(user_id: str, device_id: str) -> list[dict[str, Any]]:
+def _forget_app_installations(user_id: str, device_id: str, inames: list[str]) -> None:
+    """Evict cached lookups touched by a write to a device's apps."""
+    _device_apps_cache.pop((user_id, device_id))
+    for iname in inames:
+        _app_installation_cache.pop((user_id, device_id, iname))
+
+
+async def get_device_apps(user_id: str, device_id: str) -> list[dict[str, Any]]:
     """Get all app installations for a device.
 
+    Results are cached for a few seconds; app writes through this module
+    evict the device's entry. Each call returns its own copy of the list.
+
     Args:
         user_id: The user's UUID.
         device_id: The device ID.
@@ -284,24 +388,81 @@ def get_device_apps(user_id: str, device_id: str) -> list[dict[str, Any]]:
     Returns:
         List of app installation records.
     """
+    apps = _device_apps_cache.get((user_id, device_id))
+    if apps is not None:
+        return copy.deepcopy(apps)
+
     supabase = get_supabase_client()
 
     try:
-        response = (
+        response = await (
             supabase.table("app_installations")
-            .select("*")
+            .select(APP_INSTALLATION_COLUMNS)
             .eq("device_id", device_id)
             .eq("user_id", user_id)
             .order("created_at")
             .execute()
         )
-        return response.data or []
+        apps = cast(list[dict[str, Any]], response.data or [])
+        _device_apps_cache.set((user_id, device_id), copy.deepcopy(apps))
+        return apps
     except Exception as e:
         logger.error(f"Failed to get device apps: {e}")
         return []
 
 
-def get_app_installation(
+async def get_device_apps_for_devices(
+    user_id: str, device_ids: list[str]
+) -> dict[str, list[dict[str, Any]]]:
+    """Get the app installations of several devices in one query.
+
+    Use this instead of calling get_device_apps once per device. Devices
+    already in get_device_apps' cache are served from it; the rest are
+    fetched together and cached.
+
+    Args:
+        user_id: The user's UUID.
+        device_ids: The device IDs.
+
+    Returns:
+        Dict mapping each requested device ID to its app installation
+        records, in installation order (empty lists for devices without
+        apps, or for the uncached ones if the query fails).
+    """
+    apps: dict[str, list[dict[str, Any]]] = {device_id: [] for device_id in device_ids}
+    missing = []
+    for device_id in apps:
+        cached = _device_apps_cache.get((user_id, device_id))
+        if cached is None:
+            missing.append(device_id)
+        else:
+            apps[device_id] = copy.deepcopy(cached)
+    if not missing:
+        return apps
+
+    supabase = get_supabase_client()
+
+    try:
+        response = await (
+            supabase.table("app_installations")
+            .select(f"device_id, {APP_INSTALLATION_COLUMNS}")
+            .eq("user_id", user_id)
+            .in_("device_id", missing)
+            .order("created_at")
+            .execute()
+        )
+    except Exception as e:
+        logger.error(f"Failed to get apps for devices: {e}")
+        return apps
+
+    for row in cast(list[dict[str, Any]], response.data or []):
+        apps[row.pop("device_id")].append(row)
+    for device_id in missing:
+        _device_apps_cache.set((user_id, device_id), copy.deepcopy(apps[device_id]))
+    return apps
+
+
+async def get_app_installation(
     user_id: str, device_id: str, iname: str
 ) -> dict[str, Any] | None:
     """Get a specific app installation.
@@ -314,25 +475,32 @@ def get_app_installation(
     Returns:
         App installation record or None if not found.
     """
+    key = (user_id, device_id, iname)
+    cached = _app_installation_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached) or None
+
     supabase = get_supabase_client()
 
     try:
-        response = (
+        response = await (
             supabase.table("app_installations")
-            .select("*")
+            .select(APP_INSTALLATION_COLUMNS)
             .eq("device_id", device_id)
             .eq("user_id", user_id)
             .eq("iname", iname)
-            .single()
+            .maybe_single()
             .execute()
         )
-        return response.data
+        row = cast(dict[str, Any], response.data) if response else None
+        _app_installation_cache.set(key, copy.deepcopy(row) if row else {})
+        return row
     except Exception as e:
         logger.error(f"Failed to get app installation: {e}")
         return None
 
 
-def save_app_installation(
+async def save_app_installation(
     user_id: str, device_id: str, app_data: dict[str, Any]
 ) -> bool:
     """Save or update an app installation.
@@ -352,16 +520,53 @@ def save_app_installation(
         app_data["user_id"] = user_id
         app_data["device_id"] = device_id
 
-        supabase.table("app_installations").upsert(
-            app_data, on_conflict="device_id,iname"
-        ).execute()
+        await (
+            supabase.table("app_installations")
+            .upsert(app_data, on_conflict="device_id,iname")
+            .execute()
+        )
+        _forget_app_installations(user_id, device_id, [app_data["iname"]])
         return True
     except Exception as e:
         logger.error(f"Failed to save app installation: {e}")
         return False
 
 
-def delete_app_installation(user_id: str, device_id: str, iname: str) -> bool:
+async def save_app_installations(
+    user_id: str, device_id: str, app_data_list: list[dict[str, Any]]
+) -> bool:
+    """Save or update several app installations in batched upserts.
+
+    Prefer this over calling save_app_installation in a loop; rows go to
+    PostgREST APP_WRITE_BATCH_SIZE at a time, through the same writer as
+    flush_app_installations. If an iname appears more than once, the last
+    entry wins.
+
+    Args:
+        user_id: The user's UUID.
+        device_id: The device ID.
+        app_data_list: The app installation data to save.
+
+    Returns:
+        True if successful, False otherwise.
+    """
+    if not app_data_list:
+        return True
+
+    writes: dict[str, dict[str, Any] | None] = {
+        app_data["iname"]: app_data for app_data in app_data_list
+    }
+    try:
+        await _write_app_installations(user_id, device_id, writes)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save app installations: {e}")
+        return False
+    finally:
+        _forget_app_installations(user_id, device_id, list(writes))
+
+
+async def delete_app_installation(user_id: str, device_id: str, iname: str) -> bool:
     """Delete an app installation.
 
     Args:
@@ -375,21 +580,164 @@ def delete_app_installation(user_id: str, device_id: str, iname: str) -> bool:
     supabase = get_supabase_client()
 
     try:
-        supabase.table("app_installations").delete().eq("device_id", device_id).eq(
-            "user_id", user_id
-        ).eq("iname", iname).execute()
+        await (
+            supabase.table("app_installations")
+            .delete()
+            .eq("device_id", device_id)
+            .eq("user_id", user_id)
+            .eq("iname", iname)
+            .execute()
+        )
+        _forget_app_installations(user_id, device_id, [iname])
         return True
     except Exception as e:
         logger.error(f"Failed to delete app installation: {e}")
         return False
 
 
+def queue_app_installation_save(
+    user_id: str, device_id: str, app_data: dict[str, Any]
+) -> None:
+    """Queue an app installation upsert without waiting for Supabase.
+
+    The write is sent within APP_WRITE_FLUSH_INTERVAL_SECONDS, batched
+    with other queued writes; until then get_app_installation doesn't
+    see it. Use save_app_installation when the caller needs to know the
+    write succeeded.
+
+    Args:
+        user_id: The user's UUID.
+        device_id: The device ID.
+        app_data: The app installation data to save.
+    """
+    key = (user_id, device_id, app_data["iname"])
+    _pending_app_writes[key] = dict(app_data)
+    _forget_app_installations(user_id, device_id, [app_data["iname"]])
+
+
+def queue_app_installation_delete(user_id: str, device_id: str, iname: str) -> None:
+    """Queue an app installation delete without waiting for Supabase.
+
+    Args:
+        user_id: The user's UUID.
+        device_id: The device ID.
+        iname: The installation name.
+    """
+    key = (user_id, device_id, iname)
+    _pending_app_writes[key] = None
+    _forget_app_installations(user_id, device_id, [iname])
+
+
+async def _write_app_installations(
+    user_id: str, device_id: str, writes: dict[str, dict[str, Any] | None]
+) -> None:
+    """Send one device's queued upserts and deletes in batches."""
+    supabase = get_supabase_client()
+    rows = [
+        {**app_data, "user_id": user_id, "device_id": device_id}
+        for app_data in writes.values()
+        if app_data is not None
+    ]
+    deleted = [iname for iname, app_data in writes.items() if app_data is None]
+
+    for start in range(0, len(rows), APP_WRITE_BATCH_SIZE):
+        await (
+            supabase.table("app_installations")
+            .upsert(
+                rows[start : start + APP_WRITE_BATCH_SIZE],
+                on_conflict="device_id,iname",
+            )
+            .execute()
+        )
+    for start in range(0, len(deleted), APP_WRITE_BATCH_SIZE):
+        await (
+            supabase.table("app_installations")
+            .delete()
+            .eq("device_id", device_id)
+            .eq("user_id", user_id)
+            .in_("iname", deleted[start : start + APP_WRITE_BATCH_SIZE])
+            .execute()
+        )
+
+
+async def flush_app_installations() -> None:
+    """Send queued app installation writes to Supabase.
+
+    Writes are grouped per device. A group that fails is retried by later
+    flushes and dropped, with an error, after APP_WRITE_MAX_ATTEMPTS
+    failures. A group not sent because the flush was cancelled is put
+    back as is. Either way, a write queued again since takes precedence.
+    """
+    global _pending_app_writes
+
+    if not _pending_app_writes:
+        return
+
+    batch, _pending_app_writes = _pending_app_writes, {}
+    groups: dict[tuple[str, str], dict[str, dict[str, Any] | None]] = {}
+    for (user_id, device_id, iname), app_data in batch.items():
+        groups.setdefault((user_id, device_id), {})[iname] = app_data
+
+    unsent = dict(groups)
+    try:
+        for (user_id, device_id), writes in groups.items():
+            try:
+                await _write_app_installations(user_id, device_id, writes)
+            except Exception as e:
+                logger.error(
+                    f"Failed to write {len(writes)} app installations for "
+                    f"device {device_id}: {e}"
+                )
+                _retry_app_installations(user_id, device_id, writes)
+            else:
+                for iname in writes:
+                    _app_write_failures.pop((user_id, device_id, iname), None)
+            finally:
+                _forget_app_installations(user_id, device_id, list(writes))
+            del unsent[(user_id, device_id)]
+    finally:
+        for (user_id, device_id), writes in unsent.items():
+            for iname, app_data in writes.items():
+                _pending_app_writes.setdefault((user_id, device_id, iname), app_data)
+
+
+def _retry_app_installations(
+    user_id: str, device_id: str, writes: dict[str, dict[str, Any] | None]
+) -> None:
+    """Re-queue a failed group of writes, dropping those out of attempts."""
+    dropped = []
+    for iname, app_data in writes.items():
+        key = (user_id, device_id, iname)
+        if key in _pending_app_writes:
+            # Queued again since; the newer write starts with a clean slate
+            _app_write_failures.pop(key, None)
+            continue
+        failures = _app_write_failures.pop(key, 0) + 1
+        if failures >= APP_WRITE_MAX_ATTEMPTS:
+            dropped.append(iname)
+        else:
+            _app_write_failures[key] = failures
+            _pending_app_writes[key] = app_data
+    if dropped:
+        logger.error(
+            f"Dropping app installation writes for device {device_id} after "
+            f"{APP_WRITE_MAX_ATTEMPTS} attempts: {', '.join(dropped)}"
+        )
+
+
+async def flush_app_installations_periodically() -> None:
+    """Flush queued app writes every APP_WRITE_FLUSH_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(APP_WRITE_FLUSH_INTERVAL_SECONDS)
+        await flush_app_installations()
+
+
 # ============================================
 # ADMIN OPERATIONS (require service role key)
 # ============================================
 
 
-def get_user_by_api_key(api_key: str) -> dict[str, Any] | None:
+async def get_user_by_api_key(api_key: str) -> dict[str, Any] | None:
     """Get a user by their API key (admin operation).
 
     Args:
@@ -401,36 +749,18 @@ def get_user_by_api_key(api_key: str) -> dict[str, Any] | None:
     supabase = get_supabase_admin_client()
 
     try:
-        # Find the token
-        token_response = (
-            supabase.table("api_tokens")
-            .select("user_id")
-            .eq("token", api_key)
-            .single()
-            .execute()
-        )
-
-        if not token_response.data:
-            return None
-
-        user_id = token_response.data["user_id"]
-
-        # Get user profile
-        profile_response = (
-            supabase.table("user_profiles")
-            .select("*")
-            .eq("id", user_id)
-            .single()
-            .execute()
-        )
+        # get_user_by_api_token joins the token to its owner in one call
+        response = await supabase.rpc(
+            "get_user_by_api_token", {"p_token_hash": hash_api_key(api_key)}
+        ).execute()
 
-        return profile_response.data
+        return response.data["profile"] if response.data else None
     except Exception as e:
         logger.error(f"Failed to get user by API key: {e}")
         return None
 
 
-def get_device_by_api_key(
+async def get_device_by_api_key(
     device_id: str, api_key: str
 ) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
     """Get a device and its owner by device API key (admin operation).
@@ -445,20 +775,15 @@ def get_device_by_api_key(
     supabase = get_supabase_admin_client()
 
     try:
-        response = (
-            supabase.table("devices")
-            .select("*, user_profiles!inner(*)")
-            .eq("id", device_id)
-            .eq("api_key", api_key)
-            .single()
-            .execute()
-        )
+        response = await supabase.rpc(
+            "get_device_by_api_key", {"p_device_id": device_id, "p_api_key": api_key}
+        ).execute()
 
         if not response.data:
             return None, None
 
-        device_data = response.data
-        user_profile = device_data.pop("user_profiles", None)
+        device_data = response.data["device"]
+        user_profile = response.data["profile"]
 
         return device_data, user_profile
     except Exception as e:
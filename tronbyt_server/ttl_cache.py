@@ -0,0 +1,80 @@
+"""A small thread-safe TTL cache with LRU eviction.
+
+Used to memoize Supabase lookups (token verification, profiles) for a
+short time so repeated requests skip the network round-trip.
+
+Usage:
+    from tronbyt_server.ttl_cache import TTLCache
+
+    cache: TTLCache[str, dict] = TTLCache(maxsize=1000, ttl=30)
+    cache.set("key", {"value": 1})
+    cache.get("key")  # {"value": 1} until the entry expires
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from threading import Lock
+
+
+class TTLCache[K, V]:
+    """Mapping whose entries expire after a fixed time-to-live.
+
+    When more than ``maxsize`` entries are stored, the least recently used
+    entry is evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: K) -> V | None:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        """Store a value, optionally with a shorter TTL than the default."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        """Remove an entry and return its value if it was cached."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def pop_where(self, predicate: Callable[[K], bool]) -> int:
+        """Remove every entry whose key matches, returning how many went."""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)